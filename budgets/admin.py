@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from budgets.models import Currency, Budget, Category, Account, Expense, ExpenseModification
+from budgets.models import Currency, Budget, Category, Account, Expense, ExpenseModification, \
+    AccountBalanceSnapshot, MonthlyRollup
 
 admin.site.register(Currency)
 admin.site.register(Budget)
@@ -9,3 +10,5 @@ admin.site.register(Category)
 admin.site.register(Account)
 admin.site.register(Expense)
 admin.site.register(ExpenseModification)
+admin.site.register(AccountBalanceSnapshot)
+admin.site.register(MonthlyRollup)
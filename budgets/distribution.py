@@ -0,0 +1,59 @@
+from django.db.models import Sum
+
+from budgets.models import Category, Expense
+from common.models import TranslationEntry
+
+
+def top_categories(parents, root_id):
+    # maps each category to its ancestor which is a direct child of the root, or None outside the subtree
+    tops = {}
+
+    def resolve(cid):
+        path = []
+        while cid not in tops:
+            parent_id = parents.get(cid)
+            if cid == root_id or parent_id == root_id:
+                tops[cid] = cid
+            elif parent_id is None or parent_id in path:
+                tops[cid] = None
+            else:
+                path.append(cid)
+                cid = parent_id
+                continue
+            break
+        for child in path:
+            tops[child] = tops[cid]
+        return tops[cid]
+
+    for cid in parents:
+        resolve(cid)
+    return tops
+
+
+def spending_distribution(budget, root=None, start=None, end=None):
+    categories = Category.objects.filter(budget=budget).values_list('id', 'name', 'parent_id')
+    names = {cid: name for cid, name, _ in categories}
+    tops = top_categories({cid: parent_id for cid, _, parent_id in categories}, root.id if root else None)
+
+    expenses = Expense.objects.filter(budget=budget)
+    if start:
+        expenses = expenses.filter(created__gte=start)
+    if end:
+        expenses = expenses.filter(created__lte=end)
+    totals = expenses.order_by().values_list('category_id').annotate(total=Sum('amount'))
+
+    distribution = {}
+    for category_id, total in totals:
+        top = tops.get(category_id) if category_id else None
+        if top is None and (root or category_id):
+            continue
+        distribution[top] = distribution.get(top, 0) + total
+
+    return sorted([
+        {
+            'category': top,
+            'label': names[top] if top else TranslationEntry.get('WITHOUT_CATEGORY'),
+            'value': round(total, 2),
+        }
+        for top, total in distribution.items()
+    ], key=lambda d: -d['value'])
@@ -0,0 +1,148 @@
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from budgets.models import Expense
+from budgets.pagination import keyset_chunks
+from common.models import TranslationEntry
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_COLUMNS = ['CREATION_DATE', 'NAME', 'AMOUNT', 'ACCOUNT', 'CATEGORY', 'AUTHOR', 'EXTERNAL_REFERENCE', 'NOTE']
+
+# control characters are not allowed in XML documents
+XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+XLSX_PARTS = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/workbook.xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Expenses" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>',
+    'xl/_rels/workbook.xml.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>',
+}
+
+
+def export_expenses(budget, account=None, category=None, start=None, end=None):
+    expenses = Expense.objects.filter(budget=budget)
+    if account:
+        expenses = expenses.filter(account=account)
+    if category:
+        expenses = expenses.filter(category__in=category.subtree())
+    if start:
+        expenses = expenses.filter(created__gte=start)
+    if end:
+        expenses = expenses.filter(created__lte=end)
+    # the related names are joined in the same query, the chunks are separate queries because mysqlclient buffers
+    # whole results on the client, even those of server side cursors
+    return keyset_chunks(
+        expenses, EXPORT_CHUNK_SIZE, 'created', 'name', 'amount', 'account__name', 'category__name',
+        'author__username', 'external_reference', 'note',
+    )
+
+
+def export_header():
+    return [TranslationEntry.get(column) for column in EXPORT_COLUMNS]
+
+
+class ChunkBuffer:
+    # file like object collecting written data until it is drained
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class TextBuffer:
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def write(self, text):
+        return self.buffer.write(text.encode())
+
+
+def csv_stream(rows):
+    buffer = ChunkBuffer()
+    writer = csv.writer(TextBuffer(buffer), delimiter=';')
+    writer.writerow(export_header())
+    yield buffer.drain()
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+        if len(buffer.chunks) >= EXPORT_CHUNK_SIZE:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)):
+        return f'<c t="n"><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(XML_ILLEGAL_CHARS.sub("", str(value)))}</t></is></c>'
+
+
+def xlsx_row(values):
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+
+def xlsx_stream(rows):
+    buffer = ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        yield buffer.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'.encode()
+            )
+            sheet.write(xlsx_row(export_header()).encode())
+            for i, row in enumerate(rows, 1):
+                sheet.write(xlsx_row(row).encode())
+                if i % EXPORT_CHUNK_SIZE == 0:
+                    yield buffer.drain()
+            sheet.write('</sheetData></worksheet>'.encode())
+        yield buffer.drain()
+    yield buffer.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'xlsx': (xlsx_stream, XLSX_CONTENT_TYPE),
+}
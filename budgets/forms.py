@@ -1,3 +1,5 @@
+from datetime import date
+
 from ajax_select.fields import AutoCompleteSelectField, AutoCompleteSelectMultipleField
 from bootstrap_datepicker_plus.widgets import DatePickerInput
 from django import forms
@@ -6,6 +8,8 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
 from budgets.models import Account, Currency, Expense, Category, Budget
+from budgets.reports import COMPARE_PREVIOUS, COMPARE_YEAR
+from budgets.statements import detect_format
 from common.models import TranslationEntry
 
 
@@ -130,6 +134,15 @@ class ExpenseForm(forms.ModelForm):
         model = Expense
         fields = ['name', 'account', 'category', 'amount', 'created', 'external_reference', 'note']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.id:
+            # kept for the history of the expense, saving the form replaces the related objects of the instance.
+            # Only objects loaded with the expense are kept, the history queries the names of missing ones.
+            for field in ('category', 'account'):
+                setattr(self.instance, f'_loaded_{field}',
+                        Expense._meta.get_field(field).get_cached_value(self.instance, None))
+
     def clean(self):
         cleaned_data = super().clean()
         account = cleaned_data.get('account')
@@ -139,3 +152,120 @@ class ExpenseForm(forms.ModelForm):
             raise ValidationError(TranslationEntry.get('NOT_ENOUGH_MONEY'))
 
         return self.cleaned_data
+
+
+class DistributionFilterForm(forms.Form):
+    category = forms.IntegerField(
+        required=False,
+    )
+    start = forms.DateField(
+        input_formats=settings.DATE_INPUT_FORMATS,
+        required=False,
+    )
+    end = forms.DateField(
+        input_formats=settings.DATE_INPUT_FORMATS,
+        required=False,
+    )
+
+
+class ReportFilterForm(forms.Form):
+    start = forms.DateField(
+        widget=DatePickerInput(),
+        input_formats=settings.DATE_INPUT_FORMATS,
+        label='START_DATE',
+        required=False,
+    )
+    end = forms.DateField(
+        widget=DatePickerInput(),
+        input_formats=settings.DATE_INPUT_FORMATS,
+        label='END_DATE',
+        required=False,
+    )
+    compare = forms.ChoiceField(
+        choices=[(COMPARE_PREVIOUS, 'COMPARE_PREVIOUS'), (COMPARE_YEAR, 'COMPARE_YEAR')],
+        label='COMPARISON',
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        today = date.today()
+        cleaned_data['start'] = cleaned_data.get('start') or today.replace(day=1)
+        cleaned_data['end'] = cleaned_data.get('end') or today
+        cleaned_data['compare'] = cleaned_data.get('compare') or COMPARE_PREVIOUS
+        if cleaned_data['start'] > cleaned_data['end']:
+            raise ValidationError(TranslationEntry.get('INVALID_DATE_RANGE'))
+        return cleaned_data
+
+
+class ExportFilterForm(forms.Form):
+    account = forms.IntegerField(
+        required=False,
+    )
+    category = forms.IntegerField(
+        required=False,
+    )
+    start = forms.DateField(
+        input_formats=settings.DATE_INPUT_FORMATS,
+        required=False,
+    )
+    end = forms.DateField(
+        input_formats=settings.DATE_INPUT_FORMATS,
+        required=False,
+    )
+    format = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('xlsx', 'XLSX')],
+        required=False,
+    )
+
+
+class ExpenseImportForm(forms.Form):
+    account = forms.ModelChoiceField(
+        Account.objects.none(),
+        empty_label=None,
+        label='ACCOUNT',
+    )
+    category = forms.ModelChoiceField(
+        Category.objects.none(),
+        label='CATEGORY',
+        required=False,
+    )
+    file = forms.FileField(
+        label='STATEMENT_FILE',
+    )
+    format = forms.ChoiceField(
+        choices=[('', 'AUTO_DETECT'), ('csv', 'CSV'), ('camt053', 'CAMT.053'), ('ofx', 'OFX')],
+        label='FORMAT',
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        statement = cleaned_data.get('file')
+        if statement and not cleaned_data.get('format'):
+            cleaned_data['format'] = detect_format(statement.name)
+            if not cleaned_data['format']:
+                raise ValidationError({'format': TranslationEntry.get('UNKNOWN_STATEMENT_FORMAT')})
+        return cleaned_data
+
+
+class ExpenseBulkEditForm(forms.Form):
+    expenses = forms.ModelMultipleChoiceField(
+        Expense.objects.none(),
+    )
+    category = forms.ModelChoiceField(
+        Category.objects.none(),
+        label='CATEGORY',
+        required=False,
+    )
+    account = forms.ModelChoiceField(
+        Account.objects.none(),
+        label='ACCOUNT',
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('category') and not cleaned_data.get('account'):
+            raise ValidationError(TranslationEntry.get('NO_CHANGES'))
+        return cleaned_data
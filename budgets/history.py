@@ -0,0 +1,25 @@
+from itertools import groupby
+
+from budgets.models import Expense
+
+
+def balance_history(accounts):
+    balances = {a.id: a.start_balance for a in accounts}
+    expenses = Expense.objects.filter(
+        account__in=list(balances),
+        created__isnull=False,
+    ).order_by('created', 'id').values_list('created', 'account_id', 'amount')
+
+    series = []
+    for created, day_expenses in groupby(expenses, key=lambda e: e[0]):
+        # a balance at a given date includes every expense of that day
+        day_expenses = list(day_expenses)
+        for _, account_id, amount in day_expenses:
+            balances[account_id] -= amount
+
+        x = created.strftime('%Y/%m/%d')
+        for _, _, amount in day_expenses:
+            entry = {'x': x, 'expense': amount}
+            entry.update({f'acc_{aid}': balance for aid, balance in balances.items()})
+            series.append(entry)
+    return series
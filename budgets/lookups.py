@@ -8,6 +8,13 @@ class CategoryLookup(ItemLookup):
     model = Category
     filter_field = 'name'
     suffix = 'category'
+    contains_fallback = True
+
+    def cache_scope(self, budget):
+        return f'category:{budget.id}'
+
+    def get_candidates(self, budget):
+        return Category.objects.filter(budget=budget)
 
     def format_item_display(self, item):
         onclick = f'document.getElementById(\'kill_{item.id}id_{self.suffix}\').click()'
@@ -0,0 +1,14 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def map_budgets(func, budget_ids, processes):
+    # every worker opens its own database connection, the inherited ones must not be shared
+    if processes <= 1 or len(budget_ids) <= 1:
+        return [func(budget_id) for budget_id in budget_ids]
+
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as pool:
+        return list(pool.map(func, budget_ids))
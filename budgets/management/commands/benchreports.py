@@ -0,0 +1,61 @@
+import random
+from datetime import date, timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from budgets.models import Budget, Account, Category, Expense, MonthlyRollup
+from budgets.reports import build_report, COMPARE_PREVIOUS, COMPARE_YEAR
+
+
+class Command(BaseCommand):
+    help = 'Measures the report response time on a generated budget, all generated data is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=200000, help='Number of generated expenses')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of runs, the fastest one is reported')
+        parser.add_argument('--limit', type=float, default=100, help='Maximum response time in milliseconds')
+
+    def generate(self, num_expenses):
+        rnd = random.Random(0)
+        budget = Budget.objects.create(name='Report benchmark')
+        accounts = [Account.objects.create(budget=budget, name=f'Account {i}', start_balance=0) for i in range(5)]
+        categories = [Category.objects.create(budget=budget, name=f'Category {i}') for i in range(30)]
+        first_day = date(2022, 1, 1)
+        Expense.objects.bulk_create([
+            Expense(name=f'Expense {i}', budget=budget, account=rnd.choice(accounts), category=rnd.choice(categories),
+                    created=first_day + timedelta(days=rnd.randrange(730)), amount=round(rnd.uniform(1, 100), 2))
+            for i in range(num_expenses)
+        ], batch_size=5000)
+        MonthlyRollup.rebuild(budget.id)
+        return budget
+
+    def measure(self, budget, repeat, **params):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = perf_counter()
+                build_report(budget, **params)
+                timings.append((perf_counter() - start) * 1000)
+        return min(timings), len(ctx.captured_queries)
+
+    def handle(self, *args, **options):
+        scenarios = (
+            ('month over month', {'start': date(2023, 6, 1), 'end': date(2023, 6, 30), 'compare': COMPARE_PREVIOUS}),
+            ('year over year', {'start': date(2023, 1, 1), 'end': date(2023, 12, 31), 'compare': COMPARE_YEAR}),
+            ('partial months', {'start': date(2023, 2, 14), 'end': date(2023, 9, 20), 'compare': COMPARE_PREVIOUS}),
+        )
+        slow = []
+        with transaction.atomic():
+            budget = self.generate(options['expenses'])
+            for name, params in scenarios:
+                duration, num_queries = self.measure(budget, options['repeat'], **params)
+                print(f'{name}: {duration:.1f} ms, {num_queries} queries')
+                if duration > options['limit']:
+                    slow.append(name)
+            transaction.set_rollback(True)
+
+        if slow:
+            raise CommandError(f'Slower than {options["limit"]} ms: {", ".join(slow)}')
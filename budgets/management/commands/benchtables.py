@@ -0,0 +1,106 @@
+from collections import namedtuple
+from datetime import date
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django_tables2 import TemplateColumn
+
+from budgets.tables import ExpensesTable, AccountsTable
+
+ExpenseRow = namedtuple('ExpenseRow', [
+    'id', 'budget_id', 'created', 'name', 'amount', 'category_id', 'author_name', 'category_name', 'currency_symbol',
+])
+AccountRow = namedtuple('AccountRow', [
+    'id', 'budget_id', 'name', 'balance', 'currency_symbol', 'expense_count', 'locked',
+])
+
+
+def legacy_actions_col(details_url_name):
+    return TemplateColumn(
+        '<a href="{% url "' + details_url_name + '" record.budget_id record.id %}">'
+        '<button class="btn btn-sm btn-primary"><i class="fa-solid fa-circle-info"></i></button>'
+        '</a>',
+        verbose_name='',
+        orderable=False,
+    )
+
+
+class LegacyExpensesTable(ExpensesTable):
+    amount = TemplateColumn(
+        '{{record.amount|floatformat:2 }} {{record.currency_symbol|default_if_none:""}}',
+        verbose_name='AMOUNT',
+    )
+    category = TemplateColumn(
+        '{% if record.category_id %}'
+        '<a href="{% url "budgets:category_details" record.budget_id record.category_id %}">'
+        '{{ record.category_name }}</a>'
+        '{% endif %}',
+        accessor='category_name',
+        verbose_name='CATEGORY',
+    )
+    actions = legacy_actions_col('budgets:expense_details')
+
+    class Meta(ExpensesTable.Meta):
+        pass
+
+
+class LegacyAccountsTable(AccountsTable):
+    current_balance = TemplateColumn(
+        '{{record.balance|floatformat:2}} {{record.currency_symbol|default_if_none:""}}',
+        accessor='balance',
+        verbose_name='CURRENT_BALANCE',
+    )
+    locked = TemplateColumn(
+        '{% load translations %}'
+        '{%if record.locked %}'
+        '<span class="translate text-danger font-weight-bold">{% trans_entry "YES" %}</span>'
+        '{% else %}'
+        '<span class="translate text-success font-weight-bold">{% trans_entry "NO" %}</span>'
+        '{% endif %}',
+        verbose_name='LOCKED',
+    )
+    actions = legacy_actions_col('budgets:account_details')
+
+    class Meta(AccountsTable.Meta):
+        pass
+
+
+def expense_rows(count):
+    return [
+        ExpenseRow(i, 1, date(2023, 1, 1 + i % 28), f'Expense {i}', i * 1.25, i % 20 + 1, 'user1', f'Category {i % 20}',
+                   '$')
+        for i in range(1, count + 1)
+    ]
+
+
+def account_rows(count):
+    return [AccountRow(i, 1, f'Account {i}', 1000 - i * 0.5, '$', i % 50, i % 3 == 0) for i in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    help = 'Compares the render time of the expense and account tables with template columns and python renderers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of rows per table')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of renderings, the fastest one is reported')
+
+    def render_time(self, table_class, rows, repeat):
+        request = RequestFactory().get('/')
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            table_class(rows).as_html(request)
+            timings.append(perf_counter() - start)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        cases = (
+            ('ExpensesTable', LegacyExpensesTable, ExpensesTable, expense_rows(options['rows'])),
+            ('AccountsTable', LegacyAccountsTable, AccountsTable, account_rows(options['rows'])),
+        )
+        for name, legacy_class, table_class, rows in cases:
+            before = self.render_time(legacy_class, rows, options['repeat'])
+            after = self.render_time(table_class, rows, options['repeat'])
+            print(f'{name} ({len(rows)} rows): template columns {before:.3f}s, renderers {after:.3f}s, '
+                  f'speedup {before / after:.1f}x')
@@ -0,0 +1,158 @@
+import json
+import math
+from datetime import date
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from budgets import urls as budgets_urls
+from budgets.management.commands.seedbudget import create_budgets, create_users, seed_budget
+from budgets.models import Category, Expense, ExpenseModification
+from common import urls as common_urls
+from common.models import translation_cache
+from users import urls as users_urls
+
+BUDGETS_FILE = settings.BASE_DIR / 'budgets' / 'res' / 'view_budgets.json'
+BENCHMARK_SEED = 'benchviews'
+
+URL_MODULES = (('budgets', budgets_urls), ('common', common_urls), ('users', users_urls))
+
+# query parameters and request bodies of the views which do not answer a plain GET request
+VIEW_REQUESTS = {
+    'budgets:report_data': lambda ctx: ('get', {'start': '2021-03-14', 'end': '2021-09-20'}),
+    'budgets:dashboard_data': lambda ctx: ('get', {'start': '2021-01-01', 'end': '2021-12-31'}),
+    'budgets:expenses_export': lambda ctx: ('get', {'format': 'xlsx', 'category': ctx['cid']}),
+    'budgets:expenses_bulk_edit': lambda ctx: ('post', {'expenses': ctx['page'], 'category': ctx['cid']}),
+    'common:translate': lambda ctx: ('get', {'query': 'YES,NO'}),
+}
+
+
+def url_context(budget):
+    # the category with the most expenses in its subtree and the expense with the longest history
+    categories = Category.objects.filter(budget=budget, parent__isnull=True)
+    category = max(categories, key=lambda c: c.subtree_expenses().count())
+    expense_id = ExpenseModification.objects.filter(expense__budget=budget).values('expense_id').order_by(
+        'expense_id'
+    ).first()['expense_id']
+    lang = settings.LANGUAGE_CODE
+    return {
+        'bid': budget.id,
+        'aid': budget.account_set.order_by('id').first().id,
+        'cid': category.id,
+        'eid': expense_id,
+        'lang': lang,
+        'version': translation_cache.bundle(lang)[0],
+        'page': list(Expense.objects.filter(budget=budget).order_by('-id').values_list('id', flat=True)[:50]),
+    }
+
+
+def view_requests(ctx):
+    # every named URL of the modules is requested, URLs added later cannot be missed by the benchmark
+    for namespace, module in URL_MODULES:
+        for pattern in module.urlpatterns:
+            name = f'{namespace}:{pattern.name}'
+            try:
+                url = reverse(name, kwargs={key: ctx[key] for key in pattern.pattern.converters})
+            except KeyError as e:
+                raise CommandError(f'No value for the parameter {e} of {name}')
+            method, data = VIEW_REQUESTS.get(name, lambda c: ('get', {}))(ctx)
+            yield name, url, method, data
+
+
+def measure(client, method, url, data, repeat):
+    timings, db_timings, num_queries, status = [], [], 0, None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            resp = getattr(client, method)(url, data)
+            if resp.streaming:
+                b''.join(resp.streaming_content)
+            timings.append((perf_counter() - start) * 1000)
+        db_timings.append(sum(float(q['time']) for q in queries.captured_queries) * 1000)
+        # the first request runs with cold caches and issues the most queries
+        num_queries = max(num_queries, len(queries.captured_queries))
+        status = resp.status_code
+    return {'status': status, 'queries': num_queries, 'db_ms': round(min(db_timings), 2),
+            'ms': round(min(timings), 2)}
+
+
+def headroom(result):
+    # query counts must not grow at all, the times vary with the machine
+    return {
+        'queries': result['queries'],
+        'db_ms': max(50, math.ceil(result['db_ms'] * 3 / 10) * 10),
+        'ms': max(100, math.ceil(result['ms'] * 3 / 10) * 10),
+    }
+
+
+def violations(result, budget, keys):
+    if budget is None:
+        return ['no budget']
+    return [f'{key} {result[key]} > {budget[key]}' for key in keys if result[key] > budget[key]]
+
+
+class Command(BaseCommand):
+    help = 'Requests every view of a generated budget and compares the query counts and response times with the ' \
+           'checked-in budgets, all generated data is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expenses', type=int, default=20000, help='Number of generated expenses')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of requests, the fastest one is reported')
+        parser.add_argument('--budgets', type=str, default=str(BUDGETS_FILE), help='JSON file with the budgets')
+        parser.add_argument('--json', type=str, help='If set, the results are written to this JSON file')
+        parser.add_argument('--queries-only', action='store_true',
+                            help='Compares only the query counts, the times depend on the machine')
+        parser.add_argument('--write-budgets', action='store_true',
+                            help='Writes the measured values with some headroom as new budgets')
+
+    def handle(self, *args, **options):
+        with open(options['budgets']) as f:
+            budgets = json.load(f)
+
+        results = {}
+        with transaction.atomic():
+            users = create_users(BENCHMARK_SEED, 3, None)
+            budget = create_budgets(BENCHMARK_SEED, 1, users)[0]
+            seed_budget({'seed': BENCHMARK_SEED, 'accounts': 5, 'categories': 40, 'depth': 3,
+                         'expenses': options['expenses'], 'history': 0.1, 'start': date(2021, 1, 1), 'days': 730,
+                         'batch_size': 5000}, {budget.id: 0}, budget.id)
+
+            # ids of rolled back rows are reused, cached values of earlier runs would save queries
+            cache.clear()
+            client = Client()
+            client.force_login(budget.owner)
+            for name, url, method, data in view_requests(url_context(budget)):
+                results[name] = {'url': url, 'method': method.upper(), **measure(client, method, url, data,
+                                                                                 options['repeat'])}
+            transaction.set_rollback(True)
+
+        keys = ('queries',) if options['queries_only'] else ('queries', 'db_ms', 'ms')
+        failed = []
+        for name, result in results.items():
+            problems = violations(result, budgets.get(name), keys)
+            if result['status'] >= 400:
+                problems.insert(0, f'status {result["status"]}')
+            result['violations'] = problems
+            print(f'{name}: {result["queries"]} queries, {result["db_ms"]:.1f} ms in the database, '
+                  f'{result["ms"]:.1f} ms{" - " + ", ".join(problems) if problems else ""}')
+            if problems:
+                failed.append(name)
+
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({'expenses': options['expenses'], 'database': connection.vendor, 'views': results}, f,
+                          indent=2)
+        if options['write_budgets']:
+            with open(options['budgets'], 'w') as f:
+                json.dump({name: headroom(result) for name, result in results.items()}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            return
+
+        if failed:
+            raise CommandError(f'{len(failed)} views exceed their budgets: {", ".join(failed)}')
@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budgets.management.commands._pool import map_budgets
+from budgets.models import Budget, MonthlyRollup
+
+
+def check_budget(budget_id):
+    return budget_id, MonthlyRollup.inconsistencies(budget_id)
+
+
+class Command(BaseCommand):
+    help = 'Compares the monthly expense rollups with the expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help='If set, check only the rollups of this budget')
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+
+    def handle(self, *args, **options):
+        filter_args = {'id': options['budget']} if options['budget'] else {}
+        budget_ids = list(Budget.objects.filter(**filter_args).values_list('id', flat=True))
+
+        num_errors = 0
+        for budget_id, inconsistencies in map_budgets(check_budget, budget_ids, options['processes']):
+            for (account_id, category_id, month), stored, expected in inconsistencies:
+                print(f'Budget {budget_id}, account {account_id}, category {category_id}, {month:%Y-%m}: '
+                      f'stored (amount, count) {stored}, expected {expected}')
+            num_errors += len(inconsistencies)
+
+        if num_errors:
+            raise CommandError(f'{num_errors} inconsistent rollups, run rebuildrollups to fix them')
+        print(f'Rollups of {len(budget_ids)} budgets are consistent')
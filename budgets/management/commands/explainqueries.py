@@ -0,0 +1,106 @@
+import json
+import re
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+
+from budgets.models import Account, Budget, Category, Expense, ExpenseModification, MonthlyRollup
+from budgets.pagination import EXPENSE_ORDERING, expenses_after
+
+PAGE_SIZE = 50
+
+SQLITE_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)')
+
+
+def key_queries(budget):
+    # the plans do not depend on the stored rows, missing objects are replaced by ids which match nothing
+    account_ids = list(Account.objects.filter(budget=budget).values_list('id', flat=True)) or [0]
+    category = Category.objects.filter(budget=budget).first() or Category(id=0, budget=budget, path='0/')
+    expense_id = Expense.objects.filter(budget=budget).values_list('id', flat=True).first() or 0
+    today = date.today()
+
+    return {
+        'expenses table': Expense.objects.filter(budget=budget).table_rows().order_by(*EXPENSE_ORDERING)[:PAGE_SIZE],
+        'expenses table, next page': Expense.objects.filter(budget=budget).filter(
+            expenses_after((today, expense_id))
+        ).table_rows().order_by(*EXPENSE_ORDERING)[:PAGE_SIZE],
+        'account expenses': Expense.objects.filter(account_id=account_ids[0]).table_rows().order_by(
+            *EXPENSE_ORDERING
+        )[:PAGE_SIZE],
+        'category expenses': category.subtree_expenses().table_rows().order_by(*EXPENSE_ORDERING)[:PAGE_SIZE],
+        'category totals': category.subtree_expenses().order_by().values('budget').annotate(
+            amount=Sum('amount'), count=Count('id')
+        ),
+        'expense history': ExpenseModification.objects.filter(expense_id=expense_id).order_by('-timestamp'),
+        'accounts': Account.objects.filter(budget=budget).with_balances().order_by('name'),
+        'categories': Category.objects.filter(budget=budget).order_by('name'),
+        'balance history': Expense.objects.filter(account__in=account_ids, created__isnull=False).order_by(
+            'created', 'id'
+        ).values_list('created', 'account_id', 'amount'),
+        'report rollups': MonthlyRollup.objects.filter(
+            budget=budget, month__range=(today.replace(month=1, day=1), today.replace(day=1))
+        ).values_list('month', 'account_id', 'category_id').annotate(total=Sum('amount'), num=Sum('count')).order_by(),
+        'report edges': Expense.objects.filter(budget=budget, created__range=(today.replace(day=1), today)).values_list(
+            'account_id', 'category_id'
+        ).annotate(total=Sum('amount'), num=Count('id')).order_by(),
+        'import duplicates': Expense.objects.filter(account_id=account_ids[0], import_hash__in=['0' * 40]),
+    }
+
+
+def sqlite_full_scans(plan):
+    return SQLITE_SCAN.findall(plan)
+
+
+def mysql_full_scans(plan):
+    # access type ALL reads the whole table, index reads the whole index
+    scans, nodes = [], [json.loads(plan)]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, dict):
+            if node.get('access_type') in ('ALL', 'index'):
+                scans.append(node.get('table_name', '?'))
+            nodes += node.values()
+        elif isinstance(node, list):
+            nodes += node
+    return scans
+
+
+EXPLAIN_BACKENDS = {
+    'sqlite': ({}, sqlite_full_scans),
+    'mysql': ({'format': 'JSON'}, mysql_full_scans),
+}
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the key queries of the views and fails if any of them scans a whole table or index. ' \
+           'Run it against a database with realistic data, planners prefer scans of almost empty tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help='Budget of the explained queries, defaults to the first one')
+        parser.add_argument('--verbose', action='store_true', help='Prints the plans of all queries')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN_BACKENDS:
+            raise CommandError(f'EXPLAIN checks are not supported for {connection.vendor} databases')
+        explain_options, full_scans = EXPLAIN_BACKENDS[connection.vendor]
+
+        budgets = Budget.objects.order_by('id')
+        budget = budgets.filter(id=options['budget']).first() if options['budget'] else budgets.first()
+        if budget is None:
+            raise CommandError('Budget not found')
+
+        queries, failed = key_queries(budget), []
+        for name, queryset in queries.items():
+            plan = queryset.explain(**explain_options)
+            scans = full_scans(plan)
+            print(f'{name}: {"full scan of " + ", ".join(scans) if scans else "ok"}')
+            if scans or options['verbose']:
+                print(plan)
+            if scans:
+                failed.append(name)
+
+        if failed:
+            raise CommandError(f'{len(failed)} queries scan whole tables: {", ".join(failed)}')
+        print(f'All {len(queries)} queries use indexes')
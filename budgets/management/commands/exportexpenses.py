@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from budgets.export import export_expenses, EXPORT_FORMATS
+from budgets.models import Budget, Account, Category
+
+
+class Command(BaseCommand):
+    help = 'Exports the expenses of a budget as CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=str, help='Output file, the format is taken from the extension')
+        parser.add_argument('--budget', type=int, required=True, help='Budget of the expenses')
+        parser.add_argument('--account', type=int, help='If set, export only the expenses of this account')
+        parser.add_argument('--category', type=int, help='If set, export only the expenses of this category tree')
+        parser.add_argument('--start', type=date.fromisoformat, help='First day, e.g. 2023-01-01')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day, e.g. 2023-12-31')
+
+    def handle(self, *args, **options):
+        export_format = options['file'].rsplit('.', 1)[-1].lower()
+        if export_format not in EXPORT_FORMATS:
+            raise CommandError(f'Unsupported format {export_format}, use one of {", ".join(EXPORT_FORMATS)}')
+
+        try:
+            budget = Budget.objects.get(id=options['budget'])
+            account = Account.objects.get(id=options['account'], budget=budget) if options['account'] else None
+            category = Category.objects.get(id=options['category'], budget=budget) if options['category'] else None
+        except (Budget.DoesNotExist, Account.DoesNotExist, Category.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        stream = EXPORT_FORMATS[export_format][0]
+        with open(options['file'], 'wb') as f:
+            for chunk in stream(export_expenses(budget, account, category, options['start'], options['end'])):
+                f.write(chunk)
+        print(f'Exported expenses of budget {budget.id} to {options["file"]}')
@@ -0,0 +1,42 @@
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from budgets.models import Account, Category
+from budgets.statements import import_statement, detect_format, STATEMENT_FORMATS, IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Imports the debit bookings of a bank statement (CSV, CAMT.053 or OFX) as expenses of an account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=str, help='Statement file, the format is taken from the extension')
+        parser.add_argument('--account', type=int, required=True, help='Account of the expenses')
+        parser.add_argument('--category', type=int, help='If set, the expenses are assigned to this category')
+        parser.add_argument('--author', type=str, help='Username of the author of the expenses')
+        parser.add_argument('--format', choices=list(STATEMENT_FORMATS), help='Overrides the detected format')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Expenses per transaction')
+
+    def handle(self, *args, **options):
+        statement_format = options['format'] or detect_format(options['file'])
+        if not statement_format:
+            raise CommandError(f'Unknown statement format of {options["file"]}, use --format')
+
+        try:
+            account = Account.objects.get(id=options['account'])
+            category = Category.objects.get(id=options['category'], budget=account.budget_id) \
+                if options['category'] else None
+            author = User.objects.get(username=options['author']) if options['author'] else None
+        except (Account.DoesNotExist, Category.DoesNotExist, User.DoesNotExist) as e:
+            raise CommandError(str(e))
+        if account.locked:
+            raise CommandError(f'Account {account.id} is locked')
+
+        start = perf_counter()
+        with open(options['file'], 'rb') as f:
+            result = import_statement(f, statement_format, account, category, author, options['batch_size'])
+        print(f'Imported {result["created"]} expenses into account {account.id} in {perf_counter() - start:.2f}s, '
+              f'skipped {result["duplicates"]} duplicates and {result["skipped"]} other bookings')
+        if result['error']:
+            raise CommandError(result['error'])
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from budgets.models import Account, AccountBalanceSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily balance snapshots of all accounts from their expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help='If set, rebuild only the snapshots of this budget')
+
+    def handle(self, *args, **options):
+        filter_args = {'budget_id': options['budget']} if options['budget'] else {}
+        accounts = list(Account.objects.filter(**filter_args))
+        count = AccountBalanceSnapshot.rebuild(accounts)
+        print(f'Rebuilt {count} snapshots for {len(accounts)} accounts')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from budgets.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized tree paths of all categories from their parents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help='If set, rebuild only the categories of this budget')
+
+    def handle(self, *args, **options):
+        filter_args = {'budget_id': options['budget']} if options['budget'] else {}
+        count = Category.rebuild_paths(Category.objects.filter(**filter_args))
+        print(f'Rebuilt paths of {count} categories')
@@ -0,0 +1,24 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from budgets.management.commands._pool import map_budgets
+from budgets.models import Budget, MonthlyRollup
+
+
+def rebuild_budget(budget_id):
+    return MonthlyRollup.rebuild(budget_id)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly expense rollups from the expenses, budgets are processed in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, help='If set, rebuild only the rollups of this budget')
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+
+    def handle(self, *args, **options):
+        filter_args = {'id': options['budget']} if options['budget'] else {}
+        budget_ids = list(Budget.objects.filter(**filter_args).values_list('id', flat=True))
+        counts = map_budgets(rebuild_budget, budget_ids, options['processes'])
+        print(f'Rebuilt {sum(counts)} rollups for {len(budget_ids)} budgets')
@@ -0,0 +1,234 @@
+import os
+import random
+from datetime import date, timedelta
+from functools import partial
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from budgets.management.commands._pool import map_budgets
+from budgets.models import Account, AccountBalanceSnapshot, Budget, Category, Currency, Expense, \
+    ExpenseModification, MonthlyRollup
+
+CATEGORY_NAMES = ['Food', 'Housing', 'Transport', 'Leisure', 'Health', 'Insurance', 'Education', 'Clothing',
+                  'Holidays', 'Gifts']
+EXPENSE_NAMES = ['Supermarket', 'Bakery', 'Restaurant', 'Rent', 'Electricity', 'Fuel', 'Train ticket', 'Cinema',
+                 'Pharmacy', 'Bookstore', 'Online shop', 'Hardware store', 'Coffee', 'Insurance fee', 'Hotel']
+MODIFIED_FIELDS = ['amount', 'name', 'category']
+SEED_OPTIONS = ['seed', 'accounts', 'categories', 'depth', 'expenses', 'history', 'start', 'days', 'batch_size']
+
+
+def budget_random(seed, index):
+    # every budget has its own generator, the data does not depend on the order the workers process the budgets in
+    return random.Random(f'{seed}:{index}')
+
+
+def day_weight(day):
+    # bills are paid at the beginning of the month, people shop more on weekends
+    return (2 if day.day <= 3 else 1) * (1.5 if day.weekday() >= 5 else 1)
+
+
+def daily_counts(start, days, total):
+    # spreads exactly total expenses over the days according to their weights
+    weights = [day_weight(start + timedelta(days=d)) for d in range(days)]
+    weight_sum, cumulated, emitted = sum(weights), 0, 0
+    for d, weight in enumerate(weights):
+        cumulated += weight
+        count = round(total * cumulated / weight_sum) - emitted
+        emitted += count
+        yield start + timedelta(days=d), count
+
+
+def create_categories(rng, budget_id, count, depth):
+    # roots first, every following category is attached to a random category above the maximum depth, a depth of one
+    # leaves no parents and generates roots only
+    levels, parents, num_children = [], [], {}
+    for i in range(count):
+        if i < max(1, count // 4) or not parents:
+            level, name = 0, CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+            if i >= len(CATEGORY_NAMES):
+                name += f' {i // len(CATEGORY_NAMES) + 1}'
+        else:
+            level, parent = rng.choice(parents)
+            num_children[parent] = num_children.get(parent, 0) + 1
+            level, name = level + 1, f'{parent}.{num_children[parent]}'
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(name)
+        if level < depth - 1:
+            parents.append((level, name))
+
+    # parents are inserted before their children
+    ids = {}
+    for level, names_of_level in enumerate(levels):
+        Category.objects.bulk_create([
+            Category(budget_id=budget_id, name=name, parent_id=ids[name.rsplit('.', 1)[0]] if level else None)
+            for name in names_of_level
+        ])
+        ids.update(Category.objects.filter(budget_id=budget_id, name__in=names_of_level).values_list('name', 'id'))
+    Category.rebuild_paths(Category.objects.filter(budget_id=budget_id))
+    return ids
+
+
+def create_modifications(rng, expense, categories, authors):
+    modifications = []
+    for field in rng.sample(MODIFIED_FIELDS, rng.randint(1, len(MODIFIED_FIELDS))):
+        if field == 'amount':
+            old_value, new_value = f'{round(expense.amount * rng.uniform(0.5, 1.5), 2)}', str(expense.amount)
+        elif field == 'name':
+            old_value, new_value = rng.choice(EXPENSE_NAMES), expense.name
+        else:
+            old_value, new_value = rng.choice(list(categories.values())), categories.get(expense.category_id, '')
+        modifications.append(ExpenseModification(expense_id=expense.id, field_name=field, old_value=old_value,
+                                                 new_value=new_value, updated_by_id=rng.choice(authors)))
+    return modifications
+
+
+def flush_expenses(budget_id, expenses, rng, categories, authors, history):
+    with transaction.atomic():
+        Expense.objects.bulk_create(expenses)
+        # the ids are assigned in insertion order and read back for backends without RETURNING
+        ids = reversed(Expense.objects.filter(budget_id=budget_id).order_by('-id').values_list('id', flat=True)[
+            :len(expenses)])
+        modifications = []
+        for expense, expense_id in zip(expenses, ids):
+            expense.id = expense_id
+            if rng.random() < history:
+                modifications += create_modifications(rng, expense, categories, authors)
+        ExpenseModification.objects.bulk_create(modifications)
+    return len(modifications)
+
+
+def seed_budget(options, indexes, budget_id):
+    rng = budget_random(options['seed'], indexes[budget_id])
+    budget = Budget.objects.get(id=budget_id)
+    authors = sorted(budget.write_access.values_list('id', flat=True))
+
+    Account.objects.bulk_create([
+        Account(budget_id=budget_id, name=f'Account {i + 1}') for i in range(options['accounts'])
+    ])
+    accounts = list(Account.objects.filter(budget_id=budget_id).order_by('id'))
+    category_ids = create_categories(rng, budget_id, options['categories'], options['depth'])
+    # ordered by id, so the choices follow the order the categories were generated in
+    categories = {category_id: name for name, category_id in sorted(category_ids.items(), key=lambda c: c[1])}
+    category_choices = list(categories)
+
+    spent = {a.id: 0 for a in accounts}
+    expenses, num_modifications = [], 0
+    for day, count in daily_counts(options['start'], options['days'], options['expenses']):
+        for _ in range(count):
+            # log-normal amounts, mostly small expenses and few large ones
+            amount = round(rng.lognormvariate(3, 1), 2)
+            account = rng.choice(accounts)
+            author = rng.choice(authors)
+            spent[account.id] += amount
+            expenses.append(Expense(
+                name=rng.choice(EXPENSE_NAMES), budget_id=budget_id, account=account, created=day, amount=amount,
+                category_id=rng.choice(category_choices) if rng.random() > 0.05 else None,
+                author_id=author, updated_by_id=author, import_hash=Expense.compute_import_hash(None, day, amount),
+            ))
+            if len(expenses) == options['batch_size']:
+                num_modifications += flush_expenses(budget_id, expenses, rng, categories, authors, options['history'])
+                expenses = []
+    if expenses:
+        num_modifications += flush_expenses(budget_id, expenses, rng, categories, authors, options['history'])
+
+    # the start balances cover the expenses, so the accounts end with a positive balance
+    for account in accounts:
+        account.start_balance = round(spent[account.id] * rng.uniform(1.05, 1.5), -2)
+    Account.objects.bulk_update(accounts, ['start_balance'])
+
+    # bulk_create sends no signals, the balance snapshots and rollups are built once for the whole budget
+    AccountBalanceSnapshot.rebuild(accounts)
+    MonthlyRollup.rebuild(budget_id)
+    return len(categories), num_modifications
+
+
+def create_users(seed, count, password):
+    usernames = [f'seed{seed}_user{i + 1}' for i in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    # the password is hashed once, hashing it per user would take longer than generating the expenses
+    password_hash = make_password(password)
+    User.objects.bulk_create([
+        User(username=username, password=password_hash) for username in usernames if username not in existing
+    ])
+    return list(User.objects.filter(username__in=usernames).order_by('username'))
+
+
+def budget_names(seed, count):
+    return [f'Seed {seed} budget {i + 1}' for i in range(count)]
+
+
+def create_budgets(seed, count, users):
+    currency = Currency.objects.order_by('id').first()
+    budgets = []
+    for i, name in enumerate(budget_names(seed, count)):
+        rng = budget_random(seed, f'access{i}')
+        budget = Budget.objects.create(name=name, owner=rng.choice(users), currency=currency)
+        readers = rng.sample(users, rng.randint(1, len(users)))
+        writers = rng.sample(readers, rng.randint(1, len(readers)))
+        budget.read_access.set(readers)
+        budget.write_access.set(writers)
+        budgets.append(budget)
+    return budgets
+
+
+def delete_budgets(budgets):
+    # the dependent rows are deleted by budget first, the cascade would load every expense and send its signals
+    budget_ids = list(budgets.values_list('id', flat=True))
+    with transaction.atomic():
+        ExpenseModification.objects.filter(expense__budget_id__in=budget_ids).delete()
+        AccountBalanceSnapshot.objects.filter(account__budget_id__in=budget_ids).delete()
+        MonthlyRollup.objects.filter(budget_id__in=budget_ids).delete()
+        expenses = Expense.objects.filter(budget_id__in=budget_ids)
+        expenses._raw_delete(expenses.db)
+        Budget.objects.filter(id__in=budget_ids).delete()
+
+
+class Command(BaseCommand):
+    help = 'Generates budgets with accounts, category trees, users and expenses including their history. ' \
+           'The same seed and options always generate the same data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random number generators')
+        parser.add_argument('--budgets', type=int, default=1, help='Number of budgets')
+        parser.add_argument('--users', type=int, default=5, help='Number of users with access to the budgets')
+        parser.add_argument('--password', type=str, help='Password of the users, unusable if not set')
+        parser.add_argument('--accounts', type=int, default=5, help='Number of accounts per budget')
+        parser.add_argument('--categories', type=int, default=40, help='Number of categories per budget')
+        parser.add_argument('--depth', type=int, default=3, help='Maximum depth of the category trees')
+        parser.add_argument('--expenses', type=int, default=100000, help='Number of expenses per budget')
+        parser.add_argument('--history', type=float, default=0.1, help='Share of expenses which were modified')
+        parser.add_argument('--start', type=date.fromisoformat, default=date(2020, 1, 1), help='First expense date')
+        parser.add_argument('--days', type=int, default=3 * 365, help='Number of days with expenses')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Expenses per insert')
+        parser.add_argument('--replace', action='store_true', help='Deletes budgets generated with the seed before')
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes')
+
+    def handle(self, *args, **options):
+        if min(options['budgets'], options['users'], options['accounts'], options['categories'], options['depth'],
+               options['days'], options['batch_size']) < 1 or options['expenses'] < 0:
+            raise CommandError('Counts must be positive')
+        # SQLite allows one writer at a time only, parallel workers would wait for each other's locks
+        processes = 1 if connection.vendor == 'sqlite' else options['processes']
+
+        existing = Budget.objects.filter(name__in=budget_names(options['seed'], options['budgets']))
+        if existing.exists() and not options['replace']:
+            raise CommandError(f'Budgets of seed {options["seed"]} exist already, use --replace or another seed')
+
+        start = perf_counter()
+        delete_budgets(existing)
+        users = create_users(options['seed'], options['users'], options['password'])
+        budgets = create_budgets(options['seed'], options['budgets'], users)
+        indexes = {budget.id: i for i, budget in enumerate(budgets)}
+        # only the generation options are passed on, the workers cannot unpickle the output streams of the command
+        seed_options = {key: options[key] for key in SEED_OPTIONS}
+        results = map_budgets(partial(seed_budget, seed_options, indexes), list(indexes), processes)
+
+        for budget, (num_categories, num_modifications) in zip(budgets, results):
+            print(f'Budget {budget.id} "{budget.name}": {options["accounts"]} accounts, {num_categories} categories, '
+                  f'{options["expenses"]} expenses, {num_modifications} modifications')
+        print(f'Generated {len(budgets)} budgets in {perf_counter() - start:.2f}s')
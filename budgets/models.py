@@ -1,8 +1,15 @@
+import hashlib
+from datetime import date
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Sum, OuterRef, Subquery, Count, FloatField, Value, Exists
+from django.db.models.functions import Coalesce, TruncMonth
 from django.utils.datetime_safe import datetime
 
 from common import models as model_params
+from common.models import TranslationEntry
 
 
 class Currency(models.Model):
@@ -19,6 +26,14 @@ class Currency(models.Model):
         return self.name
 
 
+class BudgetQuerySet(models.QuerySet):
+    def with_permissions(self, user):
+        return self.annotate(
+            user_can_read=Exists(Budget.read_access.through.objects.filter(budget=OuterRef('pk'), user=user.id)),
+            user_can_write=Exists(Budget.write_access.through.objects.filter(budget=OuterRef('pk'), user=user.id)),
+        )
+
+
 class Budget(models.Model):
     name = models.CharField(
         **model_params.UNIQUE_CHARFIELD,
@@ -46,9 +61,25 @@ class Budget(models.Model):
         related_name='write',
     )
 
+    objects = BudgetQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def permissions(self, user):
+        # anonymous users have no id, they must not own budgets without owner
+        if user.is_superuser or (self.owner_id is not None and user.id == self.owner_id):
+            return {'read', 'write', 'owner'}
+
+        # uses the annotations of BudgetQuerySet.with_permissions if available
+        can_read = getattr(self, 'user_can_read', None)
+        if can_read is None:
+            can_read = self.read_access.filter(id=user.id).exists()
+        can_write = getattr(self, 'user_can_write', None)
+        if can_write is None:
+            can_write = self.write_access.filter(id=user.id).exists()
+        return {p for p, granted in (('read', can_read), ('write', can_write)) if granted}
+
 
 class Category(models.Model):
     name = models.CharField(
@@ -65,20 +96,91 @@ class Category(models.Model):
         on_delete=models.SET_NULL,
         null=True,
     )
+    # ids of all ancestors and the category itself, e.g. '1/5/9/'
+    path = models.CharField(
+        max_length=255,
+        default='',
+        editable=False,
+        db_index=True,
+    )
 
     def __str__(self):
         return self.name
 
-    def descendants(self, elements=[]):
-        my_children = list(Category.objects.filter(parent=self))
-        if not my_children:
-            return
-        elements += my_children
-        for c in my_children:
-            c.descendants(elements)
+    def clean(self):
+        if not self.is_valid_parent(self.parent):
+            raise ValidationError({'parent': TranslationEntry.get('INVALID_PARENT_CATEGORY')})
+
+    def is_valid_parent(self, parent):
+        if parent is None or not self.id:
+            return True
+        return parent.id != self.id and f'/{self.id}/' not in f'/{parent.path}'
+
+    def build_path(self):
+        return f'{self.parent.path if self.parent else ""}{self.id}/'
+
+    def subtree(self):
+        # the budget narrows the path prefix search down to the index of the budget's categories
+        return Category.objects.filter(budget_id=self.budget_id, path__startswith=self.path)
+
+    def descendants(self):
+        return self.subtree().exclude(id=self.id)
+
+    def subtree_expenses(self):
+        return Expense.objects.filter(category__in=self.subtree())
+
+    @classmethod
+    def rebuild_paths(cls, categories):
+        categories = {c.id: c for c in categories}
+        paths = {}
+
+        def build(category, chain):
+            if category.id not in paths:
+                parent = categories.get(category.parent_id)
+                if parent and parent.id in chain:
+                    # cycles created before the path was introduced are cut here
+                    category.parent_id = None
+                    parent = None
+                paths[category.id] = f'{build(parent, chain | {category.id}) if parent else ""}{category.id}/'
+            return paths[category.id]
+
+        for category in categories.values():
+            category.path = build(category, {category.id})
+        cls.objects.bulk_update(categories.values(), ['parent', 'path'], batch_size=1000)
+        return len(categories)
 
     class Meta:
         unique_together = ('name', 'budget')
+        indexes = [
+            # prefix search of the category autocomplete within a budget
+            models.Index(fields=['budget', 'name']),
+            # subtree lookups by materialized path within a budget
+            models.Index(fields=['budget', 'path']),
+        ]
+
+
+class AccountQuerySet(models.QuerySet):
+    def with_balances(self, ref_dt=None):
+        spent = AccountBalanceSnapshot.objects.filter(
+            account=OuterRef('pk'),
+            day__lte=ref_dt or datetime.now(),
+        ).order_by('-day').values('spent')[:1]
+        return self.select_related('budget__currency').annotate(
+            balance=F('start_balance') - Coalesce(Subquery(spent, output_field=FloatField()), Value(0.0)),
+            expense_count=Count('expense'),
+            currency_symbol=F('budget__currency__symbol'),
+        )
+
+    def totals(self):
+        # the expenses are summed in a subquery per account, joining them would multiply the start balances
+        spent = Expense.objects.filter(account=OuterRef('pk')).order_by().values('account').annotate(
+            total=Sum('amount')
+        ).values('total')
+        return self.annotate(spent=Coalesce(Subquery(spent, output_field=FloatField()), Value(0.0))).aggregate(
+            total_budget=Coalesce(Sum('start_balance'), Value(0.0)),
+            expenses=Coalesce(Sum('spent'), Value(0.0)),
+            num_accounts=Count('id'),
+        )
 
 
 class Account(models.Model):
@@ -99,6 +201,8 @@ class Account(models.Model):
         default=False
     )
 
+    objects = AccountQuerySet.as_manager()
+
     class Meta:
         unique_together = (('budget', 'name'),)
 
@@ -116,12 +220,172 @@ class Account(models.Model):
 
     @property
     def num_expenses(self):
-        return len(Expense.objects.filter(account=self))
+        return Expense.objects.filter(account=self).count()
 
     def balance_at(self, ref_dt):
-        exp_values = Expense.objects.filter(account=self, created__lte=ref_dt).values_list('amount', flat=True)
-        exp_sum = 0 if len(exp_values) < 1 else sum(exp_values)
-        return self.start_balance - float(exp_sum)
+        snapshot = AccountBalanceSnapshot.objects.filter(account=self, day__lte=ref_dt).order_by('-day').first()
+        return self.start_balance - (snapshot.spent if snapshot else 0)
+
+
+class AccountBalanceSnapshot(models.Model):
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE
+    )
+    day = models.DateField(
+        **model_params.NOT_NULLABLE,
+    )
+    # sum of all expenses of the account up to and including this day
+    spent = models.FloatField(
+        **model_params.NOT_NULLABLE,
+        default=0
+    )
+
+    class Meta:
+        unique_together = (('account', 'day'),)
+
+    def __str__(self):
+        return f'{self.account} ({self.day})'
+
+    @classmethod
+    def add_expense(cls, account_id, day, amount):
+        if account_id is None or day is None:
+            return
+
+        with transaction.atomic():
+            if not cls.objects.filter(account_id=account_id, day=day).exists():
+                previous = cls.objects.filter(account_id=account_id, day__lt=day).order_by('-day').first()
+                cls.objects.create(account_id=account_id, day=day, spent=previous.spent if previous else 0)
+            cls.objects.filter(account_id=account_id, day__gte=day).update(spent=F('spent') + amount)
+
+    @classmethod
+    def remove_expense(cls, account_id, day, amount):
+        # never creates rows, so it is safe to call while the account itself gets deleted
+        if account_id is None or day is None:
+            return
+
+        cls.objects.filter(account_id=account_id, day__gte=day).update(spent=F('spent') - amount)
+
+    @classmethod
+    def add_expenses(cls, account_id, daily_totals):
+        # books the sums of many days at once, the affected snapshots are replaced instead of updated one by one
+        if not daily_totals:
+            return
+
+        first_day = min(daily_totals)
+        with transaction.atomic():
+            previous = cls.objects.filter(account_id=account_id, day__lt=first_day).order_by('-day').first()
+            snapshots = dict(cls.objects.filter(account_id=account_id, day__gte=first_day).values_list('day', 'spent'))
+            spent, added, replaced = previous.spent if previous else 0, 0, []
+            for day in sorted(snapshots.keys() | daily_totals.keys()):
+                spent = snapshots.get(day, spent)
+                added += daily_totals.get(day, 0)
+                replaced.append(cls(account_id=account_id, day=day, spent=spent + added))
+            cls.objects.filter(account_id=account_id, day__gte=first_day).delete()
+            cls.objects.bulk_create(replaced, batch_size=500)
+
+    @classmethod
+    def rebuild(cls, accounts):
+        account_ids = [a.id for a in accounts]
+        daily_sums = Expense.objects.filter(
+            account__in=account_ids,
+            created__isnull=False,
+        ).values('account_id', 'created').annotate(total=Sum('amount')).order_by('account_id', 'created')
+
+        snapshots = []
+        spent = {}
+        for row in daily_sums:
+            spent[row['account_id']] = spent.get(row['account_id'], 0) + row['total']
+            snapshots.append(cls(account_id=row['account_id'], day=row['created'], spent=spent[row['account_id']]))
+
+        with transaction.atomic():
+            cls.objects.filter(account__in=account_ids).delete()
+            cls.objects.bulk_create(snapshots, batch_size=1000)
+        return len(snapshots)
+
+
+class ExpenseQuerySet(models.QuerySet):
+    def totals(self):
+        return self.aggregate(amount=Coalesce(Sum('amount'), Value(0.0)), count=Count('id'))
+
+    def table_rows(self):
+        # loads exactly the columns of the expense tables as named tuples in one query
+        return self.annotate(
+            author_name=F('author__username'),
+            category_name=F('category__name'),
+            currency_symbol=F('account__budget__currency__symbol'),
+        ).values_list(
+            'id', 'budget_id', 'created', 'name', 'amount', 'category_id', 'author_name', 'category_name',
+            'currency_symbol', named=True,
+        )
+
+    def audited_update(self, user=None, **changes):
+        """
+        Moves the expenses to another category and/or account with one UPDATE and writes their history with one INSERT.
+        Balance snapshots and monthly rollups are moved in the same transaction, returns the number of changed expenses.
+        """
+        if not changes or any(field not in ('category', 'account') for field in changes):
+            raise ValueError(f'Unsupported fields {", ".join(changes)}')
+
+        targets = {f'{field}_id': obj.id if obj else None for field, obj in changes.items()}
+        with transaction.atomic():
+            changed = [
+                row for row in self.select_for_update().order_by().values(
+                    'id', 'budget_id', 'account_id', 'category_id', 'created', 'amount'
+                )
+                if any(row[attname] != target for attname, target in targets.items())
+            ]
+            if not changed:
+                return 0
+            for obj in changes.values():
+                if obj and any(row['budget_id'] != obj.budget_id for row in changed):
+                    raise ValueError(f'{obj} belongs to another budget')
+
+            account = changes.get('account')
+            if account:
+                moved = sum(row['amount'] for row in changed if row['account_id'] != account.id)
+                if account.balance_at(date.max) < moved:
+                    raise ValidationError(TranslationEntry.get('NOT_ENOUGH_MONEY'))
+
+            # names of the current categories and accounts for the history
+            names = {
+                field: dict(self.model._meta.get_field(field).related_model.objects.filter(
+                    id__in={row[f'{field}_id'] for row in changed}
+                ).values_list('id', 'name'))
+                for field in changes
+            }
+            ExpenseModification.objects.bulk_create([
+                ExpenseModification(
+                    expense_id=row['id'],
+                    field_name=field,
+                    old_value=names[field].get(row[f'{field}_id'], ''),
+                    new_value=str(obj) if obj else '',
+                    updated_by=user,
+                )
+                for row in changed for field, obj in changes.items() if row[f'{field}_id'] != targets[f'{field}_id']
+            ], batch_size=500)
+            Expense.objects.filter(id__in=[row['id'] for row in changed]).update(updated_by=user, **changes)
+
+            # the sums are moved between the buckets, the balances only change with the account
+            daily_totals, rollups = {}, {}
+            for row in changed:
+                new = {**row, **targets}
+                if row['account_id'] != new['account_id'] and row['created']:
+                    for account_id, sign in ((row['account_id'], -1), (new['account_id'], 1)):
+                        if account_id:
+                            days = daily_totals.setdefault(account_id, {})
+                            days[row['created']] = days.get(row['created'], 0) + sign * row['amount']
+                for values, sign in ((row, -1), (new, 1)):
+                    bucket = MonthlyRollup.bucket(values['budget_id'], values['account_id'], values['category_id'],
+                                                  values['created'])
+                    amount, count = rollups.get(bucket, (0, 0))
+                    rollups[bucket] = (amount + sign * row['amount'], count + sign)
+            for account_id, days in daily_totals.items():
+                AccountBalanceSnapshot.add_expenses(account_id, days)
+            for bucket, (amount, count) in rollups.items():
+                if count:
+                    MonthlyRollup.add(bucket, amount, count)
+        return len(changed)
 
 
 class Expense(models.Model):
@@ -173,6 +437,60 @@ class Expense(models.Model):
     note = models.TextField(
         **model_params.NULLABLE
     )
+    # identifies the booking of a bank statement, so statements can be imported more than once
+    import_hash = models.CharField(
+        **model_params.NULLABLE,
+        max_length=40,
+        editable=False,
+    )
+
+    objects = ExpenseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # supports the keyset pagination of the expense tables
+            models.Index(fields=['budget', 'created', 'id']),
+            models.Index(fields=['account', 'created', 'id']),
+            # category pages, the totals of a subtree are summed from the index only
+            models.Index(fields=['category', 'created', 'amount']),
+            # covers the date range aggregates of the reports, they are answered from the index only
+            models.Index(fields=['budget', 'created', 'account', 'category', 'amount']),
+            # duplicate lookup of the statement import
+            models.Index(fields=['account', 'import_hash']),
+        ]
+
+    @staticmethod
+    def compute_import_hash(external_reference, created, amount, position=0):
+        # dates and datetimes of the same day lead to the same hash, bookings without reference of the same day and
+        # amount are told apart by their position among them, the first one matches expenses entered by hand
+        value = f'{external_reference or ""}|{str(created)[:10] if created else ""}|{float(amount):.2f}'
+        if position:
+            value += f'|{position}'
+        return hashlib.sha1(value.encode()).hexdigest()
+
+    # values as last loaded from or written to the database, changes are detected without fetching the row again
+    TRACKED_FIELDS = ('account_id', 'budget_id', 'category_id', 'amount', 'name', 'note', 'created')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded_values(self):
+        # None for new instances and instances loaded without all tracked fields
+        loaded = getattr(self, '_loaded_values', None)
+        if self.id is None or loaded is None or any(f not in loaded for f in self.TRACKED_FIELDS):
+            return None
+        return loaded
+
+    def remember_loaded_values(self):
+        self._loaded_values = {f: getattr(self, f) for f in self.TRACKED_FIELDS}
+
+    def save(self, *args, **kwargs):
+        # the history, balance snapshots and rollups written by the signal handlers commit together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -201,3 +519,141 @@ class ExpenseModification(models.Model):
         **model_params.NULLABLE,
     )
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # history of an expense, latest modification first
+            models.Index(fields=['expense', '-timestamp']),
+        ]
+
+
+class MonthlyRollup(models.Model):
+    budget = models.ForeignKey(
+        Budget,
+        on_delete=models.CASCADE
+    )
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        **model_params.NULLABLE,
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        **model_params.NULLABLE,
+    )
+    # first day of the month
+    month = models.DateField(
+        **model_params.NOT_NULLABLE,
+    )
+    amount = models.FloatField(
+        **model_params.NOT_NULLABLE,
+        default=0
+    )
+    count = models.IntegerField(
+        **model_params.NOT_NULLABLE,
+        default=0
+    )
+
+    class Meta:
+        unique_together = (('budget', 'account', 'category', 'month'),)
+
+    def __str__(self):
+        return f'{self.budget} ({self.month:%Y-%m})'
+
+    @staticmethod
+    def bucket(budget_id, account_id, category_id, created):
+        if created is None:
+            return None
+        day = created.date() if isinstance(created, datetime) else created
+        return budget_id, account_id, category_id, day.replace(day=1)
+
+    @classmethod
+    def add(cls, bucket, amount, count=1):
+        if bucket is None:
+            return
+
+        budget_id, account_id, category_id, month = bucket
+        key = {'budget_id': budget_id, 'account_id': account_id, 'category_id': category_id, 'month': month}
+        with transaction.atomic():
+            updated = cls.objects.filter(**key).update(amount=F('amount') + amount, count=F('count') + count)
+            if not updated and count > 0:
+                cls.objects.create(amount=amount, count=count, **key)
+            elif count < 0:
+                cls.objects.filter(count__lte=0, **key).delete()
+
+    @classmethod
+    def remove(cls, bucket, amount):
+        # never creates rows, so it is safe to call while the budget itself gets deleted
+        cls.add(bucket, -amount, -1)
+
+    @classmethod
+    def detach(cls, field, obj_id):
+        # expenses of a deleted account or category are set to NULL, so are their buckets
+        rollups = list(cls.objects.filter(**{f'{field}_id': obj_id}))
+        if not rollups:
+            return
+
+        def key(rollup):
+            return rollup.budget_id, rollup.account_id, rollup.category_id, rollup.month
+
+        # the buckets without account or category which the detached ones are merged into, loaded at once
+        targets = {key(r): r for r in cls.objects.filter(
+            budget_id=rollups[0].budget_id, month__in={r.month for r in rollups}, **{f'{field}__isnull': True}
+        )}
+        merged, changed = [], {}
+        for rollup in rollups:
+            setattr(rollup, f'{field}_id', None)
+            target = targets.get(key(rollup))
+            if target:
+                target.amount += rollup.amount
+                target.count += rollup.count
+                merged.append(rollup.id)
+            else:
+                targets[key(rollup)] = target = rollup
+            changed[key(rollup)] = target
+
+        with transaction.atomic():
+            cls.objects.filter(id__in=merged).delete()
+            cls.objects.bulk_update(list(changed.values()), ['account', 'category', 'amount', 'count'], batch_size=500)
+
+    @classmethod
+    def aggregate_expenses(cls, budget_id):
+        return Expense.objects.filter(budget_id=budget_id, created__isnull=False).annotate(
+            month=TruncMonth('created'),
+        ).order_by().values('account_id', 'category_id', 'month').annotate(total=Sum('amount'), num=Count('id'))
+
+    @classmethod
+    def rebuild(cls, budget_id):
+        rollups = [
+            cls(budget_id=budget_id, account_id=row['account_id'], category_id=row['category_id'],
+                month=row['month'], amount=row['total'], count=row['num'])
+            for row in cls.aggregate_expenses(budget_id)
+        ]
+        with transaction.atomic():
+            cls.objects.filter(budget_id=budget_id).delete()
+            cls.objects.bulk_create(rollups, batch_size=1000)
+        return len(rollups)
+
+    @classmethod
+    def inconsistencies(cls, budget_id):
+        # returns the buckets whose stored sum or count differs from the expenses
+        expected = {
+            (row['account_id'], row['category_id'], row['month']): (row['total'], row['num'])
+            for row in cls.aggregate_expenses(budget_id)
+        }
+        stored = {
+            (r.account_id, r.category_id, r.month): (r.amount, r.count)
+            for r in cls.objects.filter(budget_id=budget_id)
+        }
+        return sorted(
+            [(key, stored.get(key), expected.get(key)) for key in expected.keys() | stored.keys()
+             if not cls.same_values(stored.get(key), expected.get(key))],
+            key=lambda m: (m[0][2], m[0][0] or 0, m[0][1] or 0),
+        )
+
+    @staticmethod
+    def same_values(stored, expected):
+        if stored is None or expected is None:
+            return stored == expected
+        return abs(stored[0] - expected[0]) < 0.005 and stored[1] == expected[1]
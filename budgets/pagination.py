@@ -0,0 +1,64 @@
+from datetime import date
+
+from django.db.models import F, Q
+
+EXPENSE_ORDERING = (F('created').desc(nulls_last=True), F('id').desc())
+CHRONOLOGICAL_ORDERING = (F('created').asc(nulls_first=True), F('id').asc())
+
+
+def encode_cursor(expense):
+    return '{}_{}'.format(expense.created.isoformat() if expense.created else '', expense.id)
+
+
+def decode_cursor(value):
+    try:
+        created, eid = value.split('_')
+        return date.fromisoformat(created) if created else None, int(eid)
+    except (AttributeError, ValueError):
+        return None
+
+
+def expenses_after(cursor):
+    created, eid = cursor
+    if created is None:
+        return Q(created__isnull=True, id__lt=eid)
+    return Q(created__lt=created) | Q(created=created, id__lt=eid) | Q(created__isnull=True)
+
+
+def expenses_later(cursor):
+    created, eid = cursor
+    if created is None:
+        return Q(created__isnull=True, id__gt=eid) | Q(created__isnull=False)
+    return Q(created__gt=created) | Q(created=created, id__gt=eid)
+
+
+def keyset_page(expenses, cursor, size):
+    """
+    Returns a page of expenses ordered by (created, id) starting behind the cursor and the cursor of the next page.
+    The position is sought via the index instead of counting and skipping all rows of the previous pages.
+    """
+    expenses = expenses.order_by(*EXPENSE_ORDERING)
+    cursor = decode_cursor(cursor)
+    if cursor:
+        expenses = expenses.filter(expenses_after(cursor))
+
+    rows = list(expenses[:size + 1])
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+
+def keyset_chunks(expenses, size, *fields):
+    """
+    Yields the fields of all expenses in chronological order, fetched by one query per chunk of the given size.
+    Every query continues behind the last row of the previous chunk, so the memory does not grow with the number of
+    expenses even on backends whose drivers buffer the whole result of a query, like mysqlclient.
+    """
+    expenses = expenses.order_by(*CHRONOLOGICAL_ORDERING).values_list('created', 'id', *fields)
+    cursor = None
+    while True:
+        rows = list((expenses.filter(expenses_later(cursor)) if cursor else expenses)[:size])
+        for row in rows:
+            yield row[2:]
+        if len(rows) < size:
+            return
+        cursor = rows[-1][:2]
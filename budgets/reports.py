@@ -0,0 +1,133 @@
+import calendar
+from datetime import date, timedelta
+
+from django.db.models import Sum, Count
+
+from budgets.models import Account, Category, Expense, MonthlyRollup
+from common.models import TranslationEntry
+
+COMPARE_PREVIOUS = 'previous'
+COMPARE_YEAR = 'year'
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def is_month_range(start, end):
+    return start.day == 1 and end == month_end(end)
+
+
+def previous_period(start, end, compare=COMPARE_PREVIOUS):
+    if compare == COMPARE_YEAR:
+        prev_end = add_months(end, -12)
+        return add_months(start, -12), month_end(prev_end) if end == month_end(end) else prev_end
+    if is_month_range(start, end):
+        # month over month, the previous period covers the same number of whole months
+        months = (end.year - start.year) * 12 + end.month - start.month + 1
+        return add_months(start, -months), month_end(add_months(start, -1))
+    return start - (end - start) - timedelta(days=1), start - timedelta(days=1)
+
+
+def split_period(start, end):
+    # whole months are read from the monthly rollups, the partial months at both ends from the expenses
+    full_months, edges = [], []
+    month = start.replace(day=1)
+    while month <= end:
+        piece = (max(start, month), min(end, month_end(month)))
+        if piece == (month, month_end(month)):
+            full_months.append(month)
+        else:
+            edges.append(piece)
+        month = add_months(month, 1)
+    return (full_months[0], full_months[-1]) if full_months else None, edges
+
+
+def period_totals(budget, start, end):
+    # rows of (month, account id, category id, amount, count), read with at most three queries
+    months, edges = split_period(start, end)
+    rows = []
+    if months:
+        rows += MonthlyRollup.objects.filter(budget=budget, month__range=months).values_list(
+            'month', 'account_id', 'category_id'
+        ).annotate(total=Sum('amount'), num=Sum('count')).order_by()
+    for edge_start, edge_end in edges:
+        # an edge lies within one month, so the expenses are grouped without truncating every date
+        month = edge_start.replace(day=1)
+        rows += [
+            (month, *row)
+            for row in Expense.objects.filter(budget=budget, created__range=(edge_start, edge_end)).values_list(
+                'account_id', 'category_id'
+            ).annotate(total=Sum('amount'), num=Count('id')).order_by()
+        ]
+    return rows
+
+
+def group_totals(rows, index):
+    totals = {}
+    for row in rows:
+        totals[row[index]] = totals.get(row[index], 0) + row[3]
+    return totals
+
+
+def change(current, previous):
+    return round((current - previous) / previous * 100, 1) if previous else None
+
+
+def compare_totals(current, previous, labels, missing_label):
+    return sorted([
+        {
+            'id': key,
+            'label': labels[key] if key in labels else TranslationEntry.get(missing_label),
+            'current': round(current.get(key, 0), 2),
+            'previous': round(previous.get(key, 0), 2),
+            'change': change(current.get(key, 0), previous.get(key, 0)),
+        }
+        for key in current.keys() | previous.keys()
+    ], key=lambda e: (-e['current'], -e['previous'], e['label']))
+
+
+def monthly_series(start, rows, count):
+    totals = group_totals(rows, 0)
+    months = [add_months(start.replace(day=1), i) for i in range(count)]
+    return months, [round(totals.get(month, 0), 2) for month in months]
+
+
+def build_report(budget, start, end, compare=COMPARE_PREVIOUS):
+    prev_start, prev_end = previous_period(start, end, compare)
+    current = period_totals(budget, start, end)
+    previous = period_totals(budget, prev_start, prev_end)
+
+    num_months = (end.year - start.year) * 12 + end.month - start.month + 1
+    months, current_series = monthly_series(start, current, num_months)
+    _, previous_series = monthly_series(prev_start, previous, num_months)
+
+    category_names = dict(Category.objects.filter(budget=budget).values_list('id', 'name'))
+    account_names = dict(Account.objects.filter(budget=budget).values_list('id', 'name'))
+    total, prev_total = sum(r[3] for r in current), sum(r[3] for r in previous)
+    return {
+        'period': {'start': start, 'end': end},
+        'previous_period': {'start': prev_start, 'end': prev_end},
+        'totals': {
+            'current': round(total, 2),
+            'previous': round(prev_total, 2),
+            'change': change(total, prev_total),
+            'count': sum(r[4] for r in current),
+        },
+        'categories': compare_totals(
+            group_totals(current, 2), group_totals(previous, 2), category_names, 'WITHOUT_CATEGORY'
+        ),
+        'accounts': compare_totals(
+            group_totals(current, 1), group_totals(previous, 1), account_names, 'WITHOUT_ACCOUNT'
+        ),
+        'series': [
+            {'x': month.strftime('%Y-%m'), 'current': value, 'previous': prev_value}
+            for month, value, prev_value in zip(months, current_series, previous_series)
+        ],
+    }
@@ -1,23 +1,206 @@
-from django.db.models.signals import pre_save
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 
-from budgets.models import Expense, ExpenseModification
+from budgets.models import Expense, ExpenseModification, AccountBalanceSnapshot, Category, MonthlyRollup, Account, \
+    Budget
+from common.models import TranslationEntry
+
+
+def _booking(account_id, created, amount):
+    day = created.date() if isinstance(created, datetime) else created
+    return account_id, day, amount
+
+
+def _loaded_values(instance):
+    # falls back to the stored row if the instance was not loaded completely
+    loaded = instance.loaded_values()
+    if loaded is None and instance.id:
+        loaded = Expense.objects.filter(id=instance.id).values(*Expense.TRACKED_FIELDS).first()
+    return loaded
+
+
+def _old_values(instance):
+    # stored by remember_booking, loaded here if it did not run for this save
+    if not hasattr(instance, '_old_values'):
+        instance._old_values = _loaded_values(instance)
+    return instance._old_values
+
+
+def _display(value):
+    return str(value) if value is not None else ''
+
+
+def _related_display(instance, field, obj_id):
+    # the form keeps the related objects the expense was loaded with, otherwise their names are queried
+    if obj_id is None:
+        return ''
+    for obj in (getattr(instance, f'_loaded_{field}', None), getattr(instance, field)):
+        if obj is not None and obj.id == obj_id:
+            return str(obj)
+    return _display(instance._meta.get_field(field).related_model.objects.filter(id=obj_id).first())
+
+
+def _deleted_with(origin, *models):
+    # origin is the instance or queryset whose delete() started the cascade
+    return isinstance(origin, models) or getattr(origin, 'model', None) in models
+
+
+def _rollup(instance):
+    return MonthlyRollup.bucket(instance.budget_id, instance.account_id, instance.category_id, instance.created), \
+        instance.amount
+
+
+@receiver(pre_save, sender=Expense)
+def remember_booking(instance, **kwargs):
+    # connected first, the following handlers reuse the old values
+    old = instance._old_values = _loaded_values(instance)
+    instance._old_booking = _booking(old['account_id'], old['created'], old['amount']) if old else None
+    instance._old_rollup = (
+        MonthlyRollup.bucket(old['budget_id'], old['account_id'], old['category_id'], old['created']), old['amount']
+    ) if old else None
 
 
 @receiver(pre_save, sender=Expense)
 def log_modification(instance, **kwargs):
-    if not instance.id:
-        return
-
-    old = Expense.objects.get(id=instance.id)
-    for field in ['category', 'amount', 'name', 'note', 'created']:
-        old_val = getattr(old, field)
-        new_val = getattr(instance, field)
-        if old_val != new_val:
-            ExpenseModification.objects.create(
-                expense=instance,
-                field_name=field,
-                old_value=str(old_val) if old_val is not None else '',
-                new_value=str(new_val) if new_val is not None else '',
-                updated_by=instance.updated_by,
-            )
+    old = _old_values(instance)
+    if not old:
+        return
+
+    modifications = []
+    for field, attname in [('category', 'category_id'), ('account', 'account_id'), ('amount', 'amount'),
+                           ('name', 'name'), ('note', 'note'), ('created', 'created')]:
+        old_val = old[attname]
+        new_val = getattr(instance, attname)
+        if old_val == new_val:
+            continue
+        if field != attname:
+            old_val, new_val = _related_display(instance, field, old_val), _related_display(instance, field, new_val)
+        modifications.append(ExpenseModification(
+            expense=instance,
+            field_name=field,
+            old_value=_display(old_val),
+            new_value=_display(new_val),
+            updated_by=instance.updated_by,
+        ))
+    ExpenseModification.objects.bulk_create(modifications)
+
+
+@receiver(pre_save, sender=Expense)
+def set_import_hash(instance, **kwargs):
+    # expenses entered by hand are recognized as well when the bank statement is imported later, the hash is kept
+    # when an expense is edited, otherwise importing its statement again would create the booking again
+    if instance.import_hash is None:
+        instance.import_hash = Expense.compute_import_hash(
+            instance.external_reference, instance.created, instance.amount
+        )
+
+
+@receiver(post_save, sender=Expense)
+def update_balance_snapshots(instance, **kwargs):
+    old = getattr(instance, '_old_booking', None)
+    new = _booking(instance.account_id, instance.created, instance.amount)
+    if old == new:
+        return
+
+    with transaction.atomic():
+        if old:
+            AccountBalanceSnapshot.remove_expense(*old)
+        AccountBalanceSnapshot.add_expense(*new)
+
+
+@receiver(post_save, sender=Expense)
+def update_monthly_rollups(instance, **kwargs):
+    old = getattr(instance, '_old_rollup', None)
+    new = _rollup(instance)
+    if old == new:
+        return
+
+    with transaction.atomic():
+        if old:
+            MonthlyRollup.remove(*old)
+        MonthlyRollup.add(*new)
+
+
+@receiver(post_save, sender=Expense)
+def remember_saved_values(instance, **kwargs):
+    instance.remember_loaded_values()
+    # the next save loads its own old values
+    vars(instance).pop('_old_values', None)
+
+
+@receiver(pre_delete, sender=Budget)
+@receiver(pre_delete, sender=Account)
+def remove_balance_snapshots(instance, **kwargs):
+    # removed in one query, the expenses deleted by the cascade skip their incremental updates
+    accounts = {'account__budget': instance} if isinstance(instance, Budget) else {'account': instance}
+    AccountBalanceSnapshot.objects.filter(**accounts).delete()
+
+
+@receiver(post_delete, sender=Expense)
+def revert_balance_snapshots(instance, origin=None, **kwargs):
+    if _deleted_with(origin, Budget, Account):
+        return
+    AccountBalanceSnapshot.remove_expense(*_booking(instance.account_id, instance.created, instance.amount))
+
+
+@receiver(post_delete, sender=Expense)
+def revert_monthly_rollups(instance, origin=None, **kwargs):
+    # the rollups of a deleted budget are deleted by the cascade
+    if _deleted_with(origin, Budget):
+        return
+    MonthlyRollup.remove(*_rollup(instance))
+
+
+@receiver(pre_delete, sender=Account)
+def detach_account_rollups(instance, origin=None, **kwargs):
+    if _deleted_with(origin, Budget):
+        return
+    MonthlyRollup.detach('account', instance.id)
+
+
+@receiver(pre_save, sender=Category)
+def prevent_category_cycles(instance, raw=False, **kwargs):
+    if not raw and not instance.is_valid_parent(instance.parent):
+        raise ValidationError(TranslationEntry.get('INVALID_PARENT_CATEGORY'))
+
+
+@receiver(post_save, sender=Category)
+def update_category_paths(instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    old_path = instance.path
+    new_path = instance.build_path()
+    if old_path == new_path:
+        return
+
+    if old_path:
+        # moves the whole subtree, including the category itself
+        Category.objects.filter(path__startswith=old_path).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=CharField())
+        )
+    else:
+        Category.objects.filter(id=instance.id).update(path=new_path)
+    instance.path = new_path
+
+
+@receiver(pre_delete, sender=Category)
+def detach_category_subtree(instance, **kwargs):
+    # children of a deleted category become top level categories
+    if instance.path:
+        Category.objects.filter(path__startswith=instance.path).exclude(id=instance.id).update(
+            path=Substr('path', len(instance.path) + 1)
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def detach_category_rollups(instance, origin=None, **kwargs):
+    if _deleted_with(origin, Budget):
+        return
+    MonthlyRollup.detach('category', instance.id)
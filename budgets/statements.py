@@ -0,0 +1,229 @@
+import csv
+import io
+import re
+from collections import namedtuple
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import islice
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from budgets.models import Account, AccountBalanceSnapshot, Expense, MonthlyRollup
+from common.models import TranslationEntry
+
+IMPORT_BATCH_SIZE = 500
+
+StatementRow = namedtuple('StatementRow', ['created', 'name', 'amount', 'reference', 'note'])
+
+OFX_TAG = re.compile(r'<(/?\w+)>([^<\r\n]*)')
+
+
+# statements repeat the same few dates many times
+@lru_cache(maxsize=4096)
+def parse_date(value, date_formats=None):
+    value = value.strip()
+    for date_format in date_formats or settings.DATE_INPUT_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_amount(value):
+    value = value.strip().replace(' ', '').replace("'", '')
+    # the last separator is the decimal point, e.g. 1.234,56 and 1,234.56, the other one separates thousands
+    decimal = max(',', '.', key=value.rfind)
+    thousands = '.' if decimal == ',' else ','
+    if value.count(decimal) > 1:
+        # only thousands separators, e.g. 1.234.567
+        decimal, thousands = None, decimal
+    value = value.replace(thousands, '')
+    if decimal:
+        value = value.replace(decimal, '.')
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_csv(f):
+    """
+    Reads statements with the columns date, name and amount and the optional columns reference and note.
+    Amounts are spent money, rows with amounts of zero or less are skipped.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(f, encoding='utf-8-sig', newline=''), delimiter=';')
+    for line in reader:
+        line = {(key or '').strip().lower(): (value or '').strip() for key, value in line.items()}
+        created = parse_date(line.get('date', ''))
+        amount = parse_amount(line.get('amount', ''))
+        if created is None or amount is None or amount <= 0:
+            yield None
+            continue
+        yield StatementRow(created, line.get('name', ''), amount, line.get('reference') or None,
+                           line.get('note') or None)
+
+
+def _local_name(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def _find_text(element, *paths):
+    # namespace agnostic lookup of the first path which leads to an element with text
+    for path in paths:
+        node = element
+        for name in path.split('/'):
+            node = next((child for child in node if _local_name(child) == name), None)
+            if node is None:
+                break
+        if node is not None and node.text and node.text.strip():
+            return node.text.strip()
+    return None
+
+
+def parse_camt053(f):
+    # entries are read one by one and dropped afterwards, the statement is never held in memory as a whole
+    for _, element in iterparse(f):
+        if _local_name(element) != 'Ntry':
+            continue
+
+        created = parse_date((_find_text(element, 'BookgDt/Dt', 'BookgDt/DtTm', 'ValDt/Dt', 'ValDt/DtTm') or '')[:10],
+                             ('%Y-%m-%d',))
+        amount = parse_amount(_find_text(element, 'Amt') or '')
+        if created is None or amount is None or _find_text(element, 'CdtDbtInd') != 'DBIT' or \
+                _find_text(element, 'RvslInd') == 'true':
+            yield None
+        else:
+            yield StatementRow(
+                created,
+                _find_text(element, 'NtryDtls/TxDtls/RltdPties/Cdtr/Nm', 'NtryDtls/TxDtls/RltdPties/Cdtr/Pty/Nm',
+                           'AddtlNtryInf', 'NtryDtls/TxDtls/RmtInf/Ustrd') or '',
+                amount,
+                _find_text(element, 'AcctSvcrRef', 'NtryRef', 'NtryDtls/TxDtls/Refs/AcctSvcrRef',
+                           'NtryDtls/TxDtls/Refs/EndToEndId'),
+                _find_text(element, 'NtryDtls/TxDtls/RmtInf/Ustrd'),
+            )
+        element.clear()
+
+
+def parse_ofx(f):
+    # OFX 1.x is SGML without closing tags, the transactions are collected tag by tag
+    transaction_tags = None
+    for line in io.TextIOWrapper(f, encoding='utf-8', errors='replace'):
+        for tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                transaction_tags = {}
+            elif tag == '/STMTTRN' and transaction_tags is not None:
+                created = parse_date(transaction_tags.get('DTPOSTED', '')[:8], ('%Y%m%d',))
+                amount = parse_amount(transaction_tags.get('TRNAMT', ''))
+                if created is None or amount is None or amount >= 0:
+                    yield None
+                else:
+                    yield StatementRow(created, transaction_tags.get('NAME', ''), -amount,
+                                       transaction_tags.get('FITID') or None, transaction_tags.get('MEMO') or None)
+                transaction_tags = None
+            elif transaction_tags is not None:
+                transaction_tags[tag] = value.strip()
+
+
+STATEMENT_FORMATS = {
+    'csv': parse_csv,
+    'camt053': parse_camt053,
+    'ofx': parse_ofx,
+}
+
+STATEMENT_EXTENSIONS = {
+    'csv': 'csv',
+    'xml': 'camt053',
+    'ofx': 'ofx',
+    'qfx': 'ofx',
+}
+
+
+def detect_format(filename):
+    return STATEMENT_EXTENSIONS.get(filename.rsplit('.', 1)[-1].lower())
+
+
+def statement_hash(row, positions):
+    # positions counts the bookings without reference per day and amount over the whole statement
+    if row.reference:
+        return Expense.compute_import_hash(row.reference, row.created, row.amount)
+    key = Expense.compute_import_hash(None, row.created, row.amount)
+    positions[key] = positions.get(key, -1) + 1
+    return Expense.compute_import_hash(None, row.created, row.amount, positions[key])
+
+
+def import_batch(account, rows, hashes, category=None, author=None):
+    expenses = []
+    with transaction.atomic():
+        account = Account.objects.select_for_update().get(id=account.id)
+        existing = set(Expense.objects.filter(account=account, import_hash__in=hashes).values_list(
+            'import_hash', flat=True
+        ))
+        for row, import_hash in zip(rows, hashes):
+            if import_hash in existing:
+                continue
+            expenses.append(Expense(
+                name=row.name[:100], budget_id=account.budget_id, account=account, category=category,
+                created=row.created, amount=row.amount, external_reference=(row.reference or '')[:200] or None,
+                note=row.note, author=author, updated_by=author, import_hash=import_hash,
+            ))
+
+        # balances only decrease, so the latest one is the lowest
+        total = sum(e.amount for e in expenses)
+        if expenses and account.balance_at(date.max) < total:
+            raise ValidationError(TranslationEntry.get('NOT_ENOUGH_MONEY'))
+        Expense.objects.bulk_create(expenses)
+
+        # bulk_create sends no signals, the snapshots and rollups are updated with the sums of the batch
+        daily_totals, monthly_totals = {}, {}
+        for e in expenses:
+            daily_totals[e.created] = daily_totals.get(e.created, 0) + e.amount
+            bucket = MonthlyRollup.bucket(account.budget_id, account.id, category.id if category else None, e.created)
+            amount, count = monthly_totals.get(bucket, (0, 0))
+            monthly_totals[bucket] = (amount + e.amount, count + 1)
+        AccountBalanceSnapshot.add_expenses(account.id, daily_totals)
+        for bucket, (amount, count) in monthly_totals.items():
+            MonthlyRollup.add(bucket, amount, count)
+    return len(expenses), len(rows) - len(expenses)
+
+
+def import_statement(f, statement_format, account, category=None, author=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Imports the debit bookings of a bank statement as expenses of the account, one transaction per batch.
+    Bookings imported before are skipped, the import stops at the first batch which exceeds the balance.
+    Unreadable bookings and bookings repeating the reference of an earlier one in the statement are skipped.
+    """
+    result = {'created': 0, 'duplicates': 0, 'skipped': 0, 'error': None}
+    parsed = STATEMENT_FORMATS[statement_format](f)
+    positions, seen = {}, set()
+    while True:
+        try:
+            batch = list(islice(parsed, batch_size))
+        except (ValueError, SyntaxError, csv.Error):
+            # undecodable text or broken XML, the batches read so far are kept
+            result['error'] = TranslationEntry.get('INVALID_STATEMENT')
+            break
+        if not batch:
+            break
+        rows, hashes = [], []
+        for row in batch:
+            import_hash = statement_hash(row, positions) if row is not None else None
+            if import_hash is None or import_hash in seen:
+                result['skipped'] += 1
+                continue
+            seen.add(import_hash)
+            rows.append(row)
+            hashes.append(import_hash)
+        try:
+            created, duplicates = import_batch(account, rows, hashes, category, author)
+        except ValidationError as e:
+            result['error'] = e.messages[0]
+            break
+        result['created'] += created
+        result['duplicates'] += duplicates
+    return result
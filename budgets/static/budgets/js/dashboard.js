@@ -11,6 +11,38 @@ function loadData(request) {
     }
 
     createHistoryChart(data.charts.history, data.lang);
+    createDistributionChart(data.charts.distribution);
+}
+
+function loadDistribution(category) {
+    let url = dashboardDataUrl + (category ? "?category=" + category : "");
+    ajaxGet(url, function (request) {
+        createDistributionChart(JSON.parse(request.responseText).charts.distribution);
+    }, ajaxFail);
+}
+
+function createDistributionChart(data) {
+    let up = document.getElementById("distUp");
+    up.style.display = data.category ? "inline-block" : "none";
+    up.onclick = function () {
+        loadDistribution(data.parent);
+    };
+
+    document.getElementById("distChart").innerHTML = "";
+    if (data.series.length === 0) {
+        return;
+    }
+    Morris.Donut({
+        element: 'distChart',
+        data: data.series,
+        formatter: function (value) {
+            return value.toFixed(2);
+        },
+    }).on('click', function (i, row) {
+        if (row.category && row.category !== data.category) {
+            loadDistribution(row.category);
+        }
+    });
 }
 
 function createHistoryChart(data, lang) {
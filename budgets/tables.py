@@ -1,34 +1,125 @@
-from django_tables2 import tables, TemplateColumn, Column
+from django.urls import reverse
+from django.utils import formats
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+from django_tables2 import Column
 
 from budgets.models import Account, Expense, Category, ExpenseModification, Budget
+from common.models import TranslationEntry
+from common.tables import TranslatedTable
+
+URL_PLACEHOLDERS = (900000001, 900000002)
+
+
+def url_format(url_name, num_args):
+    # reverses the url once with placeholder ids, the real ids are inserted per row with str.format
+    url = reverse(url_name, args=URL_PLACEHOLDERS[:num_args])
+    for i, placeholder in enumerate(URL_PLACEHOLDERS[:num_args]):
+        url = url.replace(str(placeholder), f'{{{i}}}')
+    return url
+
+
+class ActionsColumn(Column):
+    DETAILS_BUTTON = \
+        '<a href="{}"><button class="btn btn-sm btn-primary"><i class="fa-solid fa-circle-info"></i></button></a>'
+    DELETE_BUTTON = \
+        '<a href="{}"><button style="margin-left: 10px;" class="btn btn-sm btn-danger">' \
+        '<i class="fa-solid fa-trash"></i></button></a>'
+
+    def __init__(self, details_url_name, delete_url_name=None, show_delete=True, exclude_record_budget=False,
+                 **kwargs):
+        kwargs.setdefault('orderable', False)
+        kwargs.setdefault('empty_values', ())
+        super(ActionsColumn, self).__init__(verbose_name='', **kwargs)
+        self.details_url_name = details_url_name
+        self.delete_url_name = delete_url_name if show_delete else None
+        self.exclude_record_budget = exclude_record_budget
+        self.html = None
+
+    def build_html(self):
+        num_args = 1 if self.exclude_record_budget else 2
+        html = self.DETAILS_BUTTON.format(url_format(self.details_url_name, num_args))
+        if self.delete_url_name:
+            html += self.DELETE_BUTTON.format(url_format(self.delete_url_name, 2))
+        return html
+
+    def render(self, record):
+        if self.html is None:
+            self.html = self.build_html()
+        args = (record.id,) if self.exclude_record_budget else (record.budget_id, record.id)
+        return mark_safe(self.html.format(*args))
 
 
 def make_actions_col(details_url_name, delelte_url_name=None, show_delete=True, exlcude_record_budget=False, **kwargs):
-    bid = '' if exlcude_record_budget else 'record.budget.id'
-    details = \
-        '<a href="{% url "' + details_url_name + '" ' + bid + ' record.id %}">' \
-        '<button class="btn btn-sm btn-primary"><i class="fa-solid fa-circle-info"></i></button>' \
-        '</a>'
+    return ActionsColumn(details_url_name, delelte_url_name, show_delete, exlcude_record_budget, **kwargs)
 
-    delete = \
-        '<a href="{% url "' + (delelte_url_name or '') + '" record.budget.id record.id %}">' \
-        '<button style="margin-left: 10px;" class="btn btn-sm btn-danger"><i class="fa-solid fa-trash"></i></button>' \
-        '</a>'
 
-    return TemplateColumn(
-        details + (delete if show_delete else ''),
-        verbose_name='',
-        **kwargs
-    )
+class AmountColumn(Column):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('empty_values', ())
+        super(AmountColumn, self).__init__(*args, **kwargs)
+
+    def render(self, value, record):
+        amount = formats.number_format(value, decimal_pos=2) if value is not None else ''
+        symbol = conditional_escape(record.currency_symbol) if record.currency_symbol is not None else ''
+        return mark_safe(f'{amount} {symbol}')
+
+
+class CategoryLinkColumn(Column):
+    def __init__(self, *args, **kwargs):
+        super(CategoryLinkColumn, self).__init__(*args, **kwargs)
+        self.url = None
+
+    def render(self, value, record):
+        if not record.category_id:
+            return ''
+        if self.url is None:
+            self.url = url_format('budgets:category_details', 2)
+        url = self.url.format(record.budget_id, record.category_id)
+        return mark_safe(f'<a href="{url}">{conditional_escape(value)}</a>')
+
+
+class YesNoColumn(Column):
+    def __init__(self, *args, **kwargs):
+        super(YesNoColumn, self).__init__(*args, **kwargs)
+        self.html = None
+
+    def render(self, value):
+        if self.html is None:
+            self.html = {
+                True: f'<span class="translate text-danger font-weight-bold">{TranslationEntry.get("YES")}</span>',
+                False: f'<span class="translate text-success font-weight-bold">{TranslationEntry.get("NO")}</span>',
+            }
+        return mark_safe(self.html[bool(value)])
+
+
+class StyledColumn(Column):
+    def __init__(self, css_class, *args, **kwargs):
+        super(StyledColumn, self).__init__(*args, **kwargs)
+        self.css_class = css_class
+
+    def render(self, value):
+        return mark_safe(f'<span class="{self.css_class}">{conditional_escape(value)}</span>')
+
+
+class NumberColumn(Column):
+    def render(self, value):
+        return formats.number_format(value, decimal_pos=2)
+
+
+class ChangeColumn(Column):
+    def render(self, value):
+        css_class = 'text-danger' if value > 0 else 'text-success'
+        return mark_safe(f'<span class="{css_class}">{value:+.1f} %</span>')
 
 
-class BalancesTable(tables.Table):
+class BalancesTable(TranslatedTable):
     name = Column(
         verbose_name='NAME',
         attrs={'th': {'class': 'translate'}},
     )
-    current_balance = TemplateColumn(
-        '{{record.current_balance|floatformat:2}} {{record.currency.symbol}}',
+    current_balance = AmountColumn(
+        accessor='balance',
         verbose_name='CURRENT_BALANCE',
         attrs={'th': {'class': 'translate'}}
     )
@@ -48,27 +139,23 @@ class BalancesTable(tables.Table):
         ]
 
 
-class AccountsTable(tables.Table):
+class AccountsTable(TranslatedTable):
     name = Column(
         verbose_name='NAME',
         attrs={'th': {'class': 'translate'}}
     )
-    current_balance = TemplateColumn(
-        '{{record.current_balance|floatformat:2}} {{record.currency.symbol}}',
+    current_balance = AmountColumn(
+        accessor='balance',
         verbose_name='CURRENT_BALANCE',
         attrs={'th': {'class': 'translate'}}
     )
     actions = make_actions_col('budgets:account_details', show_delete=False)
     num_expenses = Column(
+        accessor='expense_count',
         verbose_name='NUM_EXPENSES',
         attrs={'th': {'class': 'translate'}},
     )
-    locked = TemplateColumn(
-        '{%if record.locked %}'
-        '<span class="translate text-danger font-weight-bold">YES</span>'
-        '{% else %}'
-        '<span class="translate text-success font-weight-bold">NO</span>'
-        '{% endif %}',
+    locked = YesNoColumn(
         verbose_name='LOCKED',
         attrs={
             'th': {'class': 'translate'},
@@ -91,12 +178,13 @@ class AccountsTable(tables.Table):
         ]
 
 
-class ExpensesTable(tables.Table):
+class ExpensesTable(TranslatedTable):
     created = Column(
         verbose_name='CREATION_DATE',
         attrs={'th': {'class': 'translate'}},
     )
     author = Column(
+        accessor='author_name',
         verbose_name='AUTHOR',
         attrs={'th': {'class': 'translate'}},
     )
@@ -104,19 +192,20 @@ class ExpensesTable(tables.Table):
         verbose_name='NAME',
         attrs={'th': {'class': 'translate'}},
     )
-    amount = TemplateColumn(
-        '{{record.amount|floatformat:2 }} {{record.account.currency.symbol}}',
+    amount = AmountColumn(
         verbose_name='AMOUNT',
         attrs={'th': {'class': 'translate'}},
     )
-    category = TemplateColumn(
-        '<a href="{% url "budgets:category_details" record.budget.id record.category.id %}">{{ record.category }}</a>',
+    category = CategoryLinkColumn(
+        accessor='category_name',
         verbose_name='CATEGORY',
         attrs={'th': {'class': 'translate'}},
     )
     actions = make_actions_col('budgets:expense_details', show_delete=False)
 
     class Meta:
+        # rows are paged by a cursor on (created, id), so the order is fixed
+        orderable = False
         model = Expense
         template_name = 'django_tables2/bootstrap4.html'
         sequence = (
@@ -133,7 +222,7 @@ class ExpensesTable(tables.Table):
         ]
 
 
-class CategoriesTable(tables.Table):
+class CategoriesTable(TranslatedTable):
     name = Column(
         verbose_name='NAME',
         attrs={'th': {'class': 'translate'}},
@@ -153,7 +242,32 @@ class CategoriesTable(tables.Table):
         ]
 
 
-class ExpenseModificationsTable(tables.Table):
+class SelectionColumn(Column):
+    # the checkboxes belong to the form given by its id, so the table needs no surrounding form
+    def __init__(self, form_id, field_name, **kwargs):
+        kwargs.setdefault('orderable', False)
+        kwargs.setdefault('empty_values', ())
+        super(SelectionColumn, self).__init__(
+            verbose_name=mark_safe(
+                f'<input type="checkbox" onclick="document.querySelectorAll(\'input[form={form_id}]\')'
+                f'.forEach(c => c.checked = this.checked)">'
+            ),
+            **kwargs
+        )
+        self.html = f'<input type="checkbox" form="{form_id}" name="{field_name}" value="{{}}">'
+
+    def render(self, record):
+        return mark_safe(self.html.format(record.id))
+
+
+class SelectableExpensesTable(ExpensesTable):
+    selection = SelectionColumn('bulk-edit', 'expenses')
+
+    class Meta(ExpensesTable.Meta):
+        sequence = ('selection',) + ExpensesTable.Meta.sequence
+
+
+class ExpenseModificationsTable(TranslatedTable):
     timestamp = Column(
         verbose_name='TIMESTAMP',
         attrs={'th': {'class': 'translate'}},
@@ -166,13 +280,13 @@ class ExpenseModificationsTable(tables.Table):
         verbose_name='FIELD_NAME',
         attrs={'th': {'class': 'translate'}},
     )
-    old_value = TemplateColumn(
-        '<span class="text-danger">{{value}}</span>',
+    old_value = StyledColumn(
+        'text-danger',
         verbose_name='OLD_VALUE',
         attrs={'th': {'class': 'translate'}},
     )
-    new_value = TemplateColumn(
-        '<span class="text-success">{{value}}</span>',
+    new_value = StyledColumn(
+        'text-success',
         verbose_name='NEW_VALUE',
         attrs={'th': {'class': 'translate'}},
     )
@@ -200,7 +314,7 @@ class ExpenseModificationsTable(tables.Table):
         ]
 
 
-class BudgetsTable(tables.Table):
+class BudgetsTable(TranslatedTable):
     actions = make_actions_col('budgets:dashboard', show_delete=False, exlcude_record_budget=True)
 
     class Meta:
@@ -216,3 +330,26 @@ class BudgetsTable(tables.Table):
             'id',
             'owner'
         ]
+
+
+class ReportTable(TranslatedTable):
+    label = Column(
+        verbose_name='NAME',
+        attrs={'th': {'class': 'translate'}},
+    )
+    current = NumberColumn(
+        verbose_name='CURRENT_PERIOD',
+        attrs={'th': {'class': 'translate'}},
+    )
+    previous = NumberColumn(
+        verbose_name='PREVIOUS_PERIOD',
+        attrs={'th': {'class': 'translate'}},
+    )
+    change = ChangeColumn(
+        verbose_name='CHANGE',
+        attrs={'th': {'class': 'translate'}},
+    )
+
+    class Meta:
+        orderable = False
+        template_name = 'django_tables2/bootstrap4.html'
@@ -0,0 +1,624 @@
+import io
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from budgets.forms import ExpenseForm
+from budgets.models import Budget, Account, Expense, AccountBalanceSnapshot, Category, MonthlyRollup, \
+    ExpenseModification
+from budgets.management.commands.explainqueries import sqlite_full_scans, mysql_full_scans
+from budgets.pagination import keyset_chunks, keyset_page
+from budgets.signals import remember_booking
+from budgets.statements import import_statement, parse_amount
+
+
+class AccountBalanceSnapshotTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        self.a1 = Account.objects.create(name='a1', budget=self.budget, start_balance=1000)
+        self.a2 = Account.objects.create(name='a2', budget=self.budget, start_balance=500)
+
+    def create_expense(self, account, created, amount):
+        return Expense.objects.create(name='e', budget=self.budget, account=account, created=created, amount=amount)
+
+    def snapshots(self, account):
+        return list(AccountBalanceSnapshot.objects.filter(account=account).order_by('day').values_list('day', 'spent'))
+
+    def test_balance_at(self):
+        self.create_expense(self.a1, date(2023, 1, 10), 100)
+        self.create_expense(self.a1, date(2023, 1, 10), 50)
+        self.create_expense(self.a1, date(2023, 2, 1), 25)
+
+        self.assertEqual(1000, self.a1.balance_at(date(2023, 1, 9)))
+        self.assertEqual(850, self.a1.balance_at(date(2023, 1, 10)))
+        self.assertEqual(850, self.a1.balance_at(date(2023, 1, 31)))
+        self.assertEqual(825, self.a1.balance_at(date(2023, 2, 1)))
+        self.assertEqual(825, self.a1.current_balance)
+
+    def test_back_dated_insert(self):
+        self.create_expense(self.a1, date(2023, 3, 1), 100)
+        self.create_expense(self.a1, date(2023, 1, 1), 10)
+
+        self.assertEqual([(date(2023, 1, 1), 10), (date(2023, 3, 1), 110)], self.snapshots(self.a1))
+        self.assertEqual(990, self.a1.balance_at(date(2023, 2, 1)))
+
+    def test_modification(self):
+        expense = self.create_expense(self.a1, date(2023, 3, 1), 100)
+        self.create_expense(self.a1, date(2023, 4, 1), 10)
+
+        expense.amount = 40
+        expense.created = date(2023, 5, 1)
+        expense.save()
+        self.assertEqual(1000, self.a1.balance_at(date(2023, 3, 31)))
+        self.assertEqual(990, self.a1.balance_at(date(2023, 4, 1)))
+        self.assertEqual(950, self.a1.balance_at(date(2023, 5, 1)))
+
+    def test_account_move(self):
+        expense = self.create_expense(self.a1, date(2023, 3, 1), 100)
+        expense.account = self.a2
+        expense.save()
+
+        self.assertEqual(1000, self.a1.balance_at(date(2023, 3, 1)))
+        self.assertEqual(400, self.a2.balance_at(date(2023, 3, 1)))
+
+    def test_deletion(self):
+        expense = self.create_expense(self.a1, date(2023, 3, 1), 100)
+        self.create_expense(self.a1, date(2023, 4, 1), 10)
+        expense.delete()
+
+        self.assertEqual(1000, self.a1.balance_at(date(2023, 3, 1)))
+        self.assertEqual(990, self.a1.balance_at(date(2023, 4, 1)))
+
+    def test_budget_deletion(self):
+        for day in range(1, 11):
+            self.create_expense(self.a1, date(2023, 3, day), 100)
+        with CaptureQueriesContext(connection) as ctx:
+            self.budget.delete()
+        self.assertEqual(0, AccountBalanceSnapshot.objects.count())
+        # the snapshots are deleted in bulk instead of being reverted per expense
+        self.assertEqual([], [q['sql'] for q in ctx.captured_queries
+                              if q['sql'].startswith('UPDATE "budgets_accountbalancesnapshot"')])
+
+    def test_account_deletion(self):
+        self.create_expense(self.a1, date(2023, 3, 1), 100)
+        self.create_expense(self.a2, date(2023, 3, 1), 10)
+        self.a1.delete()
+        self.assertEqual([(date(2023, 3, 1), 10)], self.snapshots(self.a2))
+        self.assertEqual(1, AccountBalanceSnapshot.objects.count())
+
+    def test_rebuild(self):
+        self.create_expense(self.a1, date(2023, 3, 1), 100)
+        self.create_expense(self.a1, date(2023, 1, 1), 10)
+        self.create_expense(self.a2, date(2023, 2, 1), 20)
+        expected = [self.snapshots(self.a1), self.snapshots(self.a2)]
+
+        AccountBalanceSnapshot.objects.all().delete()
+        call_command('rebuildbalances', budget=self.budget.id)
+        self.assertEqual(expected, [self.snapshots(self.a1), self.snapshots(self.a2)])
+
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        self.root = Category.objects.create(name='root', budget=self.budget)
+        self.child = Category.objects.create(name='child', budget=self.budget, parent=self.root)
+        self.leaf = Category.objects.create(name='leaf', budget=self.budget, parent=self.child)
+        self.other = Category.objects.create(name='other', budget=self.budget)
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_paths(self):
+        self.assertEqual(f'{self.root.id}/{self.child.id}/{self.leaf.id}/', self.leaf.path)
+        with self.assertNumQueries(1):
+            self.assertEqual(['child', 'leaf'], self.names(self.root.descendants()))
+        self.assertEqual(['child', 'leaf', 'root'], self.names(self.root.subtree()))
+
+    def test_subtree_expenses(self):
+        account = Account.objects.create(name='a1', budget=self.budget)
+        for category in (self.root, self.leaf, self.other):
+            Expense.objects.create(name=category.name, budget=self.budget, category=category, account=account,
+                                   created=date(2023, 1, 1), amount=1)
+        with self.assertNumQueries(1):
+            self.assertEqual(['leaf', 'root'], self.names(self.root.subtree_expenses()))
+        with self.assertNumQueries(1):
+            self.assertEqual({'amount': 2, 'count': 2}, self.root.subtree_expenses().totals())
+        self.assertEqual({'amount': 0, 'count': 0}, Expense.objects.none().totals())
+
+    def test_reparent(self):
+        self.child.parent = self.other
+        self.child.save()
+        self.assertEqual(['child', 'leaf'], self.names(self.other.descendants()))
+        self.assertEqual([], self.names(self.root.descendants()))
+        self.leaf.refresh_from_db()
+        self.assertEqual(f'{self.other.id}/{self.child.id}/{self.leaf.id}/', self.leaf.path)
+
+    def test_deletion(self):
+        self.child.delete()
+        self.leaf.refresh_from_db()
+        self.assertIsNone(self.leaf.parent)
+        self.assertEqual(f'{self.leaf.id}/', self.leaf.path)
+        self.assertEqual([], self.names(self.root.descendants()))
+
+    def test_cycle_prevention(self):
+        self.root.parent = self.leaf
+        with self.assertRaises(ValidationError):
+            self.root.full_clean()
+        with self.assertRaises(ValidationError):
+            self.root.save()
+
+        self.child.parent = self.child
+        with self.assertRaises(ValidationError):
+            self.child.save()
+
+    def test_rebuild(self):
+        expected = self.names(self.root.descendants())
+        Category.objects.update(path='')
+        call_command('rebuildcategories', budget=self.budget.id)
+        self.root.refresh_from_db()
+        self.assertEqual(expected, self.names(self.root.descendants()))
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        for day, name in ((1, 'a'), (2, 'b'), (2, 'c'), (None, 'd'), (3, 'e')):
+            Expense.objects.create(name=name, budget=self.budget, amount=1,
+                                   created=date(2023, 1, day) if day else None)
+
+    def test_pages(self):
+        names, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(Expense.objects.filter(budget=self.budget), cursor, 2)
+            names.append([e.name for e in rows])
+            if not cursor:
+                break
+        self.assertEqual([['e', 'c'], ['b', 'a'], ['d']], names)
+
+    def test_invalid_cursor(self):
+        rows, cursor = keyset_page(Expense.objects.filter(budget=self.budget), 'foo', 10)
+        self.assertEqual(5, len(rows))
+        self.assertIsNone(cursor)
+
+    def test_table_rows(self):
+        expenses = Expense.objects.filter(budget=self.budget).table_rows()
+        rows, cursor = keyset_page(expenses, None, 2)
+        self.assertEqual(['e', 'c'], [r.name for r in rows])
+        rows, cursor = keyset_page(expenses, cursor, 2)
+        self.assertEqual(['b', 'a'], [r.name for r in rows])
+        self.assertIsNone(rows[0].category_name)
+
+    def test_chunks(self):
+        expenses = Expense.objects.filter(budget=self.budget)
+        with self.assertNumQueries(3):
+            self.assertEqual(['d', 'a', 'b', 'c', 'e'], [name for name, in keyset_chunks(expenses, 2, 'name')])
+        with self.assertNumQueries(2):
+            self.assertEqual(5, len(list(keyset_chunks(expenses, 5, 'name'))))
+        self.assertEqual([('b',)], list(keyset_chunks(expenses.filter(name='b'), 2, 'name')))
+
+
+class MonthlyRollupTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        self.a1 = Account.objects.create(name='a1', budget=self.budget, start_balance=1000)
+        self.a2 = Account.objects.create(name='a2', budget=self.budget, start_balance=1000)
+        self.c1 = Category.objects.create(name='c1', budget=self.budget)
+        self.c2 = Category.objects.create(name='c2', budget=self.budget)
+
+    def create_expense(self, account, category, created, amount):
+        return Expense.objects.create(name='e', budget=self.budget, account=account, category=category,
+                                      created=created, amount=amount)
+
+    def rollups(self):
+        return sorted(MonthlyRollup.objects.filter(budget=self.budget).values_list(
+            'account_id', 'category_id', 'month', 'amount', 'count'
+        ), key=lambda r: (r[2], r[0] or 0, r[1] or 0))
+
+    def assert_consistent(self):
+        self.assertEqual([], MonthlyRollup.inconsistencies(self.budget.id))
+
+    def test_buckets(self):
+        self.create_expense(self.a1, self.c1, date(2023, 1, 10), 100)
+        self.create_expense(self.a1, self.c1, date(2023, 1, 20), 50)
+        self.create_expense(self.a1, self.c2, date(2023, 1, 20), 10)
+        self.create_expense(self.a1, self.c1, date(2023, 2, 1), 25)
+        self.assertEqual([
+            (self.a1.id, self.c1.id, date(2023, 1, 1), 150, 2),
+            (self.a1.id, self.c2.id, date(2023, 1, 1), 10, 1),
+            (self.a1.id, self.c1.id, date(2023, 2, 1), 25, 1),
+        ], self.rollups())
+
+    def test_modifications(self):
+        expense = self.create_expense(self.a1, self.c1, date(2023, 1, 10), 100)
+        self.create_expense(self.a1, self.c1, date(2023, 1, 20), 50)
+
+        expense.amount = 40
+        expense.save()
+        self.assertEqual([(self.a1.id, self.c1.id, date(2023, 1, 1), 90, 2)], self.rollups())
+
+        expense.created = date(2023, 3, 5)
+        expense.account = self.a2
+        expense.category = self.c2
+        expense.save()
+        self.assertEqual([
+            (self.a1.id, self.c1.id, date(2023, 1, 1), 50, 1),
+            (self.a2.id, self.c2.id, date(2023, 3, 1), 40, 1),
+        ], self.rollups())
+
+        expense.delete()
+        self.assertEqual([(self.a1.id, self.c1.id, date(2023, 1, 1), 50, 1)], self.rollups())
+        self.assert_consistent()
+
+    def test_deleted_account_and_category(self):
+        self.create_expense(self.a1, self.c1, date(2023, 1, 10), 100)
+        self.create_expense(self.a2, self.c1, date(2023, 1, 10), 10)
+        self.create_expense(self.a2, None, date(2023, 1, 10), 1)
+        self.c1.delete()
+        self.assert_consistent()
+        self.a2.delete()
+        self.assertEqual([
+            (None, None, date(2023, 1, 1), 11, 2),
+            (self.a1.id, None, date(2023, 1, 1), 100, 1),
+        ], self.rollups())
+        self.assert_consistent()
+
+        self.budget.delete()
+        self.assertEqual(0, MonthlyRollup.objects.count())
+
+    def test_detach_queries(self):
+        for month in range(1, 13):
+            self.create_expense(self.a1, self.c1, date(2023, month, 1), 10)
+            self.create_expense(self.a1, self.c2, date(2023, month, 1), 5)
+            self.create_expense(self.a2, self.c2, date(2023, month, 1), 1)
+        # loading the buckets, merging and moving them does not depend on the number of buckets
+        for category in (self.c1, self.c2):
+            with CaptureQueriesContext(connection) as ctx:
+                MonthlyRollup.detach('category', category.id)
+            self.assertLessEqual(len(ctx.captured_queries), 6)
+        self.assertEqual(36, sum(count for *_, count in self.rollups()))
+        self.assertEqual(24, len(self.rollups()))
+
+    def test_budget_deletion(self):
+        for month in range(1, 13):
+            self.create_expense(self.a1, self.c1, date(2023, month, 1), 10)
+        with CaptureQueriesContext(connection) as ctx:
+            self.budget.delete()
+        self.assertEqual(0, MonthlyRollup.objects.count())
+        # the cascade deletes the rollups, the expenses do not revert them one by one
+        self.assertEqual([], [q['sql'] for q in ctx.captured_queries
+                              if q['sql'].startswith('UPDATE "budgets_monthlyrollup"')])
+
+    def test_rebuild_and_check(self):
+        self.create_expense(self.a1, self.c1, date(2023, 1, 10), 100)
+        self.create_expense(self.a2, self.c2, date(2023, 2, 10), 10)
+        expected = self.rollups()
+
+        MonthlyRollup.objects.filter(account=self.a1).update(amount=1)
+        MonthlyRollup.objects.filter(account=self.a2).delete()
+        with self.assertRaises(CommandError):
+            call_command('checkrollups', budget=self.budget.id, processes=1)
+
+        call_command('rebuildrollups', budget=self.budget.id, processes=1)
+        self.assertEqual(expected, self.rollups())
+        call_command('checkrollups', processes=1)
+
+
+class ExpenseModificationTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        self.account = Account.objects.create(name='a1', budget=self.budget, start_balance=1000)
+        self.food = Category.objects.create(name='food', budget=self.budget)
+        self.rent = Category.objects.create(name='rent', budget=self.budget)
+        Expense.objects.create(name='e1', budget=self.budget, account=self.account, category=self.food,
+                               created=date(2023, 1, 1), amount=10)
+
+    def modifications(self):
+        return sorted(ExpenseModification.objects.values_list('field_name', 'old_value', 'new_value'))
+
+    def test_without_remember_booking(self):
+        pre_save.disconnect(remember_booking, sender=Expense)
+        self.addCleanup(pre_save.connect, remember_booking, sender=Expense)
+
+        expense = Expense.objects.get()
+        for name in ('e2', 'e3'):
+            expense.name = name
+            expense.save()
+        self.assertEqual([('name', 'e1', 'e2'), ('name', 'e2', 'e3')], self.modifications())
+
+    def test_form_edit_queries(self):
+        expense = Expense.objects.select_related('account', 'category').get()
+        form = ExpenseForm(instance=expense, data={
+            'name': 'e2', 'account': self.account.id, 'category': self.rent.id, 'amount': 20,
+            'created': '2023-01-01', 'note': 'n',
+        })
+        self.assertTrue(form.is_valid())
+        expense = form.save(commit=False)
+
+        with CaptureQueriesContext(connection) as ctx:
+            expense.save()
+        expense_queries = [q['sql'] for q in ctx.captured_queries if 'expense' in q['sql'].split('WHERE')[0]]
+        self.assertEqual(2, len(expense_queries))
+        self.assertTrue(expense_queries[0].startswith('INSERT INTO "budgets_expensemodification"'))
+        self.assertTrue(expense_queries[1].startswith('UPDATE "budgets_expense"'))
+        self.assertEqual([('amount', '10.0', '20.0'), ('category', 'food', 'rent'), ('name', 'e1', 'e2'),
+                          ('note', '', 'n')], self.modifications())
+        self.assertEqual(980, self.account.current_balance)
+
+    def test_form_without_related_objects(self):
+        expense = Expense.objects.get()
+        with self.assertNumQueries(0):
+            form = ExpenseForm(instance=expense, data={
+                'name': 'e2', 'account': self.account.id, 'category': self.rent.id, 'amount': 10,
+                'created': '2023-01-01', 'note': 'n',
+            })
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual([('category', 'food', 'rent'), ('name', 'e1', 'e2'), ('note', '', 'n')],
+                         self.modifications())
+
+    def test_repeated_and_partial_saves(self):
+        expense = Expense.objects.get()
+        expense.category = None
+        expense.save()
+        expense.created = date(2023, 2, 1)
+        expense.save()
+
+        # the row is fetched again if the instance was loaded without all tracked fields
+        expense = Expense.objects.only('id', 'amount').get()
+        expense.amount = 30.0
+        expense.save()
+        self.assertEqual([
+            ('amount', '10.0', '30.0'), ('category', 'food', ''), ('created', '2023-01-01', '2023-02-01'),
+        ], self.modifications())
+        self.assertEqual([], MonthlyRollup.inconsistencies(self.budget.id))
+        self.assertEqual(970, self.account.current_balance)
+
+
+class AuditedUpdateTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        self.a1 = Account.objects.create(name='a1', budget=self.budget, start_balance=1000)
+        self.a2 = Account.objects.create(name='a2', budget=self.budget, start_balance=50)
+        self.food = Category.objects.create(name='food', budget=self.budget)
+        self.rent = Category.objects.create(name='rent', budget=self.budget)
+        self.expenses = [
+            Expense.objects.create(name=f'e{i}', budget=self.budget, account=self.a1, category=self.food,
+                                   created=date(2023, i, 10), amount=10 * i)
+            for i in range(1, 4)
+        ]
+
+    def assert_consistent(self):
+        days = [date(2023, month, day) for month in range(1, 5) for day in (1, 10, 20)]
+        for account in (self.a1, self.a2):
+            balances = [account.balance_at(day) for day in days]
+            AccountBalanceSnapshot.rebuild([account])
+            self.assertEqual([account.balance_at(day) for day in days], balances)
+        self.assertEqual([], MonthlyRollup.inconsistencies(self.budget.id))
+
+    def test_move(self):
+        expenses = Expense.objects.filter(id__in=[e.id for e in self.expenses[:2]])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(2, expenses.audited_update(category=self.rent, account=self.a2))
+        writes = [q['sql'] for q in ctx.captured_queries
+                  if 'expense' in q['sql'].split('WHERE')[0] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(2, len(writes))
+
+        self.assertEqual(4, ExpenseModification.objects.count())
+        self.assertEqual({('category', 'food', 'rent'), ('account', 'a1', 'a2')}, set(
+            ExpenseModification.objects.values_list('field_name', 'old_value', 'new_value')
+        ))
+        self.assertEqual(20, self.a2.current_balance)
+        self.assertEqual(970, self.a1.current_balance)
+        self.assert_consistent()
+
+        # unchanged expenses are skipped
+        self.assertEqual(1, Expense.objects.all().audited_update(category=self.rent))
+        self.assertEqual(0, Expense.objects.all().audited_update(category=self.rent))
+        self.assert_consistent()
+
+    def test_validation(self):
+        with self.assertRaises(ValidationError):
+            Expense.objects.all().audited_update(account=self.a2)
+        self.assertEqual(0, ExpenseModification.objects.count())
+        self.assertEqual(50, self.a2.current_balance)
+
+        other = Category.objects.create(name='food', budget=Budget.objects.create(name='budget2'))
+        with self.assertRaises(ValueError):
+            Expense.objects.all().audited_update(category=other)
+        with self.assertRaises(ValueError):
+            Expense.objects.all().audited_update(name='x')
+
+
+CAMT_STATEMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02"><BkToCstmrStmt><Stmt>
+<Ntry><Amt Ccy="EUR">12.50</Amt><CdtDbtInd>DBIT</CdtDbtInd><BookgDt><Dt>2023-01-05</Dt></BookgDt>
+<AcctSvcrRef>REF-1</AcctSvcrRef><NtryDtls><TxDtls><RltdPties><Cdtr><Nm>Bakery</Nm></Cdtr></RltdPties>
+<RmtInf><Ustrd>bread</Ustrd></RmtInf></TxDtls></NtryDtls></Ntry>
+<Ntry><Amt Ccy="EUR">1000.00</Amt><CdtDbtInd>CRDT</CdtDbtInd><BookgDt><Dt>2023-01-06</Dt></BookgDt></Ntry>
+<Ntry><Amt Ccy="EUR">40.00</Amt><CdtDbtInd>DBIT</CdtDbtInd><BookgDt><DtTm>2023-02-01T10:00:00</DtTm></BookgDt>
+<NtryRef>REF-2</NtryRef><AddtlNtryInf>Fuel</AddtlNtryInf></Ntry>
+</Stmt></BkToCstmrStmt></Document>"""
+
+OFX_STATEMENT = b"""OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20230105120000<TRNAMT>-12.50<FITID>F1<NAME>Bakery<MEMO>bread</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20230106<TRNAMT>1000.00<FITID>F2<NAME>Salary</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"""
+
+
+class StatementImportTest(TestCase):
+    def setUp(self):
+        self.budget = Budget.objects.create(name='budget1')
+        self.account = Account.objects.create(name='a1', budget=self.budget, start_balance=1000)
+        self.category = Category.objects.create(name='c1', budget=self.budget)
+
+    def import_csv(self, lines, **kwargs):
+        content = '\n'.join(['date;name;amount;reference'] + lines).encode()
+        return import_statement(io.BytesIO(content), 'csv', self.account, **kwargs)
+
+    def expenses(self):
+        return list(Expense.objects.filter(account=self.account).order_by('created', 'id').values_list(
+            'created', 'name', 'amount', 'external_reference'
+        ))
+
+    def assert_consistent(self):
+        snapshots = list(AccountBalanceSnapshot.objects.filter(account=self.account).order_by('day').values_list(
+            'day', 'spent'
+        ))
+        AccountBalanceSnapshot.rebuild([self.account])
+        self.assertEqual(list(AccountBalanceSnapshot.objects.filter(account=self.account).order_by('day').values_list(
+            'day', 'spent'
+        )), snapshots)
+        self.assertEqual([], MonthlyRollup.inconsistencies(self.budget.id))
+
+    def test_parse_amount(self):
+        # the last separator is the decimal point
+        self.assertEqual(1234.56, parse_amount('1,234.56'))
+        self.assertEqual(1234.56, parse_amount('1.234,56'))
+        self.assertEqual(1234.5, parse_amount('1234,5'))
+        self.assertEqual(1234567.0, parse_amount('1.234.567'))
+        self.assertEqual(-40, parse_amount('-40.00'))
+        self.assertIsNone(parse_amount('12,5 EUR'))
+
+    def test_csv(self):
+        result = self.import_csv(
+            ['05.01.2023;Bakery;12,50;R1', '2023-01-03;Fuel;40;', 'invalid;x;1;', '2023-01-04;Refund;-5;'],
+            category=self.category, batch_size=2,
+        )
+        self.assertEqual({'created': 2, 'duplicates': 0, 'skipped': 2, 'error': None}, result)
+        self.assertEqual([(date(2023, 1, 3), 'Fuel', 40, None), (date(2023, 1, 5), 'Bakery', 12.5, 'R1')],
+                         self.expenses())
+        self.assertEqual(947.5, self.account.current_balance)
+        self.assert_consistent()
+
+    def test_duplicates(self):
+        Expense.objects.create(name='manual', budget=self.budget, account=self.account, created=date(2023, 1, 3),
+                               amount=40)
+        self.import_csv(['05.01.2023;Bakery;12.50;R1', '05.01.2023;Bakery;12.50;R1'])
+        result = self.import_csv(['2023-01-03;Fuel;40;', '05.01.2023;Bakery;12.50;R1', '06.01.2023;Bakery;12.50;R2'],
+                                 batch_size=1)
+        self.assertEqual({'created': 1, 'duplicates': 2, 'skipped': 0, 'error': None}, result)
+        self.assertEqual(3, len(self.expenses()))
+        self.assert_consistent()
+
+    def test_same_day_and_amount(self):
+        # bookings without reference are told apart by their position, repeated references are skipped
+        lines = ['2023-01-03;Fuel;40;', '2023-01-04;Bakery;5;R1', '2023-01-03;Coffee;40;', '2023-01-04;Bakery;5;R1']
+        result = self.import_csv(lines, batch_size=1)
+        self.assertEqual({'created': 3, 'duplicates': 0, 'skipped': 1, 'error': None}, result)
+        result = self.import_csv(lines[:3], batch_size=2)
+        self.assertEqual({'created': 0, 'duplicates': 3, 'skipped': 0, 'error': None}, result)
+        self.assert_consistent()
+
+    def test_edited_expense(self):
+        self.import_csv(['2023-01-03;Fuel;40;', '2023-01-04;Bakery;5;R1'])
+        for expense in Expense.objects.filter(account=self.account):
+            expense.amount += 1
+            expense.created = date(2023, 1, 10)
+            expense.save()
+        result = self.import_csv(['2023-01-03;Fuel;40;', '2023-01-04;Bakery;5;R1'])
+        self.assertEqual({'created': 0, 'duplicates': 2, 'skipped': 0, 'error': None}, result)
+
+    def test_not_enough_money(self):
+        result = self.import_csv(['2023-01-01;a;600;', '2023-01-02;b;300;', '2023-01-03;c;200;'], batch_size=3)
+        self.assertEqual('NOT_ENOUGH_MONEY', result['error'])
+        self.assertEqual(0, result['created'])
+        self.assertEqual([], self.expenses())
+
+        result = self.import_csv(['2023-01-01;a;600;', '2023-01-02;b;300;', '2023-01-03;c;200;'], batch_size=1)
+        self.assertEqual(2, result['created'])
+        self.assertEqual(100, self.account.current_balance)
+        self.assert_consistent()
+
+    def test_camt053(self):
+        result = import_statement(io.BytesIO(CAMT_STATEMENT), 'camt053', self.account)
+        self.assertEqual({'created': 2, 'duplicates': 0, 'skipped': 1, 'error': None}, result)
+        self.assertEqual([(date(2023, 1, 5), 'Bakery', 12.5, 'REF-1'), (date(2023, 2, 1), 'Fuel', 40, 'REF-2')],
+                         self.expenses())
+        self.assertEqual('bread', Expense.objects.get(external_reference='REF-1').note)
+        self.assert_consistent()
+
+        result = import_statement(io.BytesIO(CAMT_STATEMENT.replace(b'</Stmt>', b'')), 'camt053', self.account)
+        self.assertEqual('INVALID_STATEMENT', result['error'])
+        self.assertEqual(2, len(self.expenses()))
+
+    def test_ofx(self):
+        result = import_statement(io.BytesIO(OFX_STATEMENT), 'ofx', self.account)
+        self.assertEqual({'created': 1, 'duplicates': 0, 'skipped': 1, 'error': None}, result)
+        self.assertEqual([(date(2023, 1, 5), 'Bakery', 12.5, 'F1')], self.expenses())
+
+
+class ExplainQueriesTest(TestCase):
+    def test_key_queries_use_indexes(self):
+        budget = Budget.objects.create(name='budget1')
+        account = Account.objects.create(name='a1', budget=budget, start_balance=100)
+        category = Category.objects.create(name='c1', budget=budget)
+        Expense.objects.create(name='e1', budget=budget, account=account, category=category, amount=10,
+                               created=date(2023, 1, 1))
+        call_command('explainqueries', budget=budget.id)
+
+    def test_full_scans(self):
+        self.assertEqual([], sqlite_full_scans('SEARCH budgets_expense USING INDEX idx (budget_id=?)'))
+        self.assertEqual(['budgets_expense', 'budgets_category'], sqlite_full_scans(
+            'SCAN budgets_expense\nSCAN budgets_category USING COVERING INDEX idx\nSCAN CONSTANT ROW'
+        ))
+        self.assertEqual(['budgets_category'], mysql_full_scans(
+            '{"query_block": {"nested_loop": [{"table": {"table_name": "budgets_expense", "access_type": "ref"}}, '
+            '{"table": {"table_name": "budgets_category", "access_type": "ALL"}}]}}'
+        ))
+
+
+class SeedBudgetTest(TestCase):
+    def dump(self, budget):
+        return (
+            list(Expense.objects.filter(budget=budget).order_by('id').values_list(
+                'created', 'name', 'amount', 'account__name', 'category__name', 'author__username'
+            )),
+            list(ExpenseModification.objects.filter(expense__budget=budget).order_by('id').values_list(
+                'field_name', 'old_value', 'new_value', 'updated_by__username'
+            )),
+            list(Category.objects.filter(budget=budget).order_by('name').values_list('name', 'parent__name')),
+            list(Account.objects.filter(budget=budget).order_by('name').values_list('name', 'start_balance')),
+        )
+
+    def test_deterministic(self):
+        options = {'seed': 3, 'budgets': 2, 'users': 3, 'accounts': 2, 'categories': 12, 'depth': 3,
+                   'expenses': 300, 'history': 0.2, 'days': 60, 'batch_size': 70}
+        call_command('seedbudget', **options)
+        b1, b2 = Budget.objects.order_by('id')
+        first = [self.dump(b1), self.dump(b2)]
+        self.assertNotEqual(first[0], first[1])
+
+        with self.assertRaises(CommandError):
+            call_command('seedbudget', **options)
+        call_command('seedbudget', replace=True, **options)
+        b1, b2 = Budget.objects.order_by('id')
+        self.assertEqual(first, [self.dump(b1), self.dump(b2)])
+        # nothing of the replaced budgets is left behind
+        self.assertEqual(600, Expense.objects.count())
+        self.assertEqual(sum(len(dump[1]) for dump in first), ExpenseModification.objects.count())
+        self.assertFalse(MonthlyRollup.objects.exclude(budget__in=[b1, b2]).exists())
+        self.assertFalse(AccountBalanceSnapshot.objects.exclude(account__budget__in=[b1, b2]).exists())
+        self.assertEqual(3, User.objects.filter(username__startswith='seed3_').count())
+
+        expenses, modifications, categories, _ = self.dump(b1)
+        self.assertEqual(300, len(expenses))
+        self.assertTrue(modifications)
+        self.assertTrue(any(parent for _, parent in categories))
+        for category in Category.objects.filter(budget=b1, parent__isnull=False):
+            self.assertTrue(category.path.endswith(f'{category.parent_id}/{category.id}/'))
+        for account in Account.objects.filter(budget=b1):
+            self.assertGreater(account.current_balance, 0)
+        call_command('checkrollups', processes=1)
+
+    def test_flat_categories(self):
+        call_command('seedbudget', seed=4, users=1, accounts=1, categories=12, depth=1, expenses=20, days=5)
+        categories = Category.objects.filter(budget=Budget.objects.get())
+        self.assertEqual(12, categories.count())
+        self.assertFalse(categories.filter(parent__isnull=False).exists())
@@ -1,13 +1,27 @@
 import datetime
+import io
 import json
+import os
+import tempfile
+import zipfile
+from contextlib import redirect_stdout
+from xml.etree import ElementTree
 from datetime import datetime as dt
 
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django_webtest import WebTest
 
+from budgets.distribution import spending_distribution
 from budgets.models import Budget, Account, Expense, Currency, Category, ExpenseModification
+from common.models import TranslationEntry, translation_cache
+from users.lookups import UserReadAccessLookup
 
 USER_PASSWORD = '12345'
 
@@ -183,11 +197,181 @@ class DashboardDataViewTest(TestCase):
         self.assertEqual('1000.00', stats['total_budget'])
         self.assertEqual(2, stats['num_accounts'])
 
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                {'total_budget': 1000, 'expenses': 400, 'num_accounts': 2},
+                Account.objects.filter(budget=self.budget, locked=False).totals(),
+            )
+
         self.assertIn('charts', data)
         charts = data.get('charts')
         self.assertIn('series', charts['history'])
         self.assertIn('series', charts['history'])
 
+    def test_history_data(self):
+        a1 = Account.objects.create(name='a1', budget=self.budget, start_balance=500, locked=False)
+        a2 = Account.objects.create(name='a2', budget=self.budget, start_balance=300, locked=False)
+        a3 = Account.objects.create(name='a3', budget=self.budget, start_balance=500, locked=True)
+
+        year = dt.now().year
+        Expense.objects.create(name='e1', budget=self.budget, created=dt(year, 1, 1), amount=100, account=a1)
+        Expense.objects.create(name='e2', budget=self.budget, created=dt(year, 1, 1), amount=50, account=a2)
+        Expense.objects.create(name='e3', budget=self.budget, created=dt(year, 2, 1), amount=25, account=a1)
+        Expense.objects.create(name='e4', budget=self.budget, created=dt(year, 3, 1), amount=100, account=a3)
+
+        history = json.loads(self.test_as_ro_user().content.decode())['charts']['history']
+        self.assertEqual(['expense', f'acc_{a1.id}', f'acc_{a2.id}'], history['ykeys'])
+        self.assertEqual(['EXPENSES', 'a1', 'a2'], history['labels'])
+        self.assertEqual([
+            {'x': f'{year}/01/01', 'expense': 100, f'acc_{a1.id}': 400, f'acc_{a2.id}': 250},
+            {'x': f'{year}/01/01', 'expense': 50, f'acc_{a1.id}': 400, f'acc_{a2.id}': 250},
+            {'x': f'{year}/02/01', 'expense': 25, f'acc_{a1.id}': 375, f'acc_{a2.id}': 250},
+        ], history['series'])
+
+    def test_distribution(self):
+        food = Category.objects.create(name='food', budget=self.budget)
+        fruit = Category.objects.create(name='fruit', budget=self.budget, parent=food)
+        apples = Category.objects.create(name='apples', budget=self.budget, parent=fruit)
+        rent = Category.objects.create(name='rent', budget=self.budget)
+        for category, day, amount in ((food, 1, 10), (fruit, 2, 20), (apples, 3, 30), (rent, 4, 100), (None, 5, 5)):
+            Expense.objects.create(name='e', budget=self.budget, category=category, created=dt(2023, 1, day),
+                                   amount=amount)
+
+        def distribution(**params):
+            resp = self.client.get(self.url, params)
+            self.assertEqual(200, resp.status_code)
+            return json.loads(resp.content.decode())['charts']['distribution']
+
+        self.test_as_ro_user()
+        self.assertEqual([
+            {'category': rent.id, 'label': 'rent', 'value': 100},
+            {'category': food.id, 'label': 'food', 'value': 60},
+            {'category': None, 'label': 'WITHOUT_CATEGORY', 'value': 5},
+        ], distribution()['series'])
+
+        data = distribution(category=food.id)
+        self.assertEqual(None, data['parent'])
+        self.assertEqual([
+            {'category': fruit.id, 'label': 'fruit', 'value': 50},
+            {'category': food.id, 'label': 'food', 'value': 10},
+        ], data['series'])
+        self.assertEqual([{'category': fruit.id, 'label': 'fruit', 'value': 20}],
+                         distribution(category=food.id, start='2023-01-02', end='2023-01-02')['series'])
+
+        self.assertEqual(400, self.client.get(self.url, {'start': 'foo'}).status_code)
+        other = Category.objects.create(name='other', budget=Budget.objects.create(name='budget2'))
+        self.assertEqual(404, self.client.get(self.url, {'category': other.id}).status_code)
+
+    def test_distribution_queries(self):
+        with self.assertNumQueries(2):
+            spending_distribution(self.budget)
+
+    def _count_data_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url)
+        self.assertEqual(200, resp.status_code)
+        return len(ctx.captured_queries)
+
+    def test_constant_query_count(self):
+        self.budget.read_access.add(self.test_user)
+        self.client.login(username=self.test_user.username, password=USER_PASSWORD)
+        a1 = Account.objects.create(name='a1', budget=self.budget, start_balance=500)
+        Expense.objects.create(name='e1', budget=self.budget, created=dt(2023, 1, 1), amount=1, account=a1)
+        num_queries = self._count_data_queries()
+
+        for i in range(2, 6):
+            account = Account.objects.create(name=f'a{i}', budget=self.budget, start_balance=500)
+            for day in range(1, 11):
+                Expense.objects.create(
+                    name=f'e{i}{day}', budget=self.budget, created=dt(2023, i, day), amount=1, account=account
+                )
+        self.assertEqual(num_queries, self._count_data_queries())
+
+
+class ReportViewTest(TestCase, BudgetSetup):
+    def setUp(self):
+        self.prepare_budget()
+        self.a1 = Account.objects.create(budget=self.budget, name='a1', start_balance=10000)
+        self.a2 = Account.objects.create(budget=self.budget, name='a2', start_balance=10000)
+        self.c1 = Category.objects.create(name='c1', budget=self.budget)
+        self.c2 = Category.objects.create(name='c2', budget=self.budget)
+        for account, category, created, amount in (
+                (self.a1, self.c1, datetime.date(2022, 3, 15), 1000),
+                (self.a1, self.c1, datetime.date(2023, 1, 31), 10),
+                (self.a1, self.c1, datetime.date(2023, 2, 1), 100),
+                (self.a1, self.c2, datetime.date(2023, 2, 20), 50),
+                (self.a2, self.c2, datetime.date(2023, 3, 1), 200),
+                (self.a2, None, datetime.date(2023, 3, 15), 5),
+        ):
+            Expense.objects.create(name='e', budget=self.budget, account=account, category=category, created=created,
+                                   amount=amount)
+        self.url = reverse('budgets:report_data', kwargs={'bid': self.budget.id})
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+
+    def get_report(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(200, resp.status_code)
+        return json.loads(resp.content.decode())
+
+    def test_month_over_month(self):
+        report = self.get_report(start='2023-03-01', end='2023-03-31')
+        self.assertEqual({'start': '2023-02-01', 'end': '2023-02-28'}, report['previous_period'])
+        self.assertEqual({'current': 205, 'previous': 150, 'change': 36.7, 'count': 2}, report['totals'])
+        self.assertEqual([
+            {'id': self.c2.id, 'label': 'c2', 'current': 200, 'previous': 50, 'change': 300.0},
+            {'id': None, 'label': 'WITHOUT_CATEGORY', 'current': 5, 'previous': 0, 'change': None},
+            {'id': self.c1.id, 'label': 'c1', 'current': 0, 'previous': 100, 'change': -100.0},
+        ], report['categories'])
+        self.assertEqual([
+            {'id': self.a2.id, 'label': 'a2', 'current': 205, 'previous': 0, 'change': None},
+            {'id': self.a1.id, 'label': 'a1', 'current': 0, 'previous': 150, 'change': -100.0},
+        ], report['accounts'])
+        self.assertEqual([{'x': '2023-03', 'current': 205, 'previous': 150}], report['series'])
+
+    def test_partial_months(self):
+        report = self.get_report(start='2023-01-31', end='2023-03-10')
+        self.assertEqual({'start': '2022-12-23', 'end': '2023-01-30'}, report['previous_period'])
+        self.assertEqual(360, report['totals']['current'])
+        self.assertEqual([
+            {'x': '2023-01', 'current': 10, 'previous': 0},
+            {'x': '2023-02', 'current': 150, 'previous': 0},
+            {'x': '2023-03', 'current': 200, 'previous': 0},
+        ], report['series'])
+
+    def test_two_partial_months(self):
+        report = self.get_report(start='2023-01-20', end='2023-02-10')
+        self.assertEqual([
+            {'x': '2023-01', 'current': 10, 'previous': 0},
+            {'x': '2023-02', 'current': 100, 'previous': 0},
+        ], report['series'])
+
+    def test_year_over_year(self):
+        report = self.get_report(start='2023-01-01', end='2023-03-31', compare='year')
+        self.assertEqual({'start': '2022-01-01', 'end': '2022-03-31'}, report['previous_period'])
+        self.assertEqual({'current': 365, 'previous': 1000, 'change': -63.5, 'count': 5}, report['totals'])
+
+    def test_bounded_number_of_queries(self):
+        self.client.get(self.url, {'start': '2023-01-15', 'end': '2023-03-10'})
+        # session, user and budget, rollups and both partial months per period, category and account names
+        with self.assertNumQueries(11):
+            self.client.get(self.url, {'start': '2023-01-15', 'end': '2023-03-10'})
+
+    def test_benchmark(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            call_command('benchreports', expenses=100, repeat=1, limit=10000)
+        self.assertIn('month over month', out.getvalue())
+        self.assertEqual(1, Budget.objects.count())
+
+    def test_invalid_range(self):
+        self.assertEqual(400, self.client.get(self.url, {'start': '2023-03-01', 'end': '2023-02-01'}).status_code)
+
+    def test_page(self):
+        resp = self.client.get(reverse('budgets:reports', kwargs={'bid': self.budget.id}),
+                               {'start': '2023-02-01', 'end': '2023-03-31'})
+        self.assertEqual(200, resp.status_code)
+        self.assertIn('c2', resp.content.decode())
+
 
 class AccountAddViewTest(WebTest, BudgetSetup, InstanceCrudSuite):
     def setUp(self):
@@ -284,6 +468,57 @@ class AccountsTableViewTest(TestCase, BudgetSetup):
         for inst in self.model_class.objects.filter(budget=self.budget):
             self.assertIn(str(inst), resp.content.decode())
 
+    def test_not_paginated(self):
+        Account.objects.bulk_create([Account(budget=self.budget, name=f'extra{i:02}') for i in range(30)])
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        for url in (self.url, reverse('budgets:dashboard', kwargs={'bid': self.budget.id})):
+            content = self.client.get(url).content.decode()
+            self.assertIn('extra00', content)
+            self.assertIn('extra29', content)
+
+    def test_server_side_translation(self):
+        TranslationEntry.objects.create(name='NUM_EXPENSES', lang=settings.LANGUAGE_CODE, text='Number of expenses')
+        TranslationEntry.objects.create(name='CATEGORIES', lang=settings.LANGUAGE_CODE, text='Categories')
+        self.addCleanup(translation_cache.invalidate)
+
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        content = self.client.get(self.url).content.decode()
+        self.assertIn('Number of expenses', content)
+        self.assertIn('<span class="translate">Categories</span>', content)
+
+    def test_balances_and_counts(self):
+        account = Account.objects.get(name='account1')
+        Expense.objects.create(name='e1', budget=self.budget, created=dt(2023, 1, 1), amount=120, account=account)
+        Expense.objects.create(name='e2', budget=self.budget, created=dt(2023, 1, 2), amount=130, account=account)
+
+        account = Account.objects.filter(id=account.id).with_balances().get()
+        self.assertEqual(750, account.balance)
+        self.assertEqual(2, account.expense_count)
+        self.assertEqual('$', account.currency_symbol)
+
+    def test_sorting(self):
+        account = Account.objects.get(name='account1')
+        Expense.objects.create(name='e1', budget=self.budget, created=dt(2023, 1, 1), amount=120, account=account)
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+
+        content = self.client.get(self.url, {'sort': 'current_balance'}).content.decode()
+        self.assertLess(content.index('account1'), content.index('account2'))
+        content = self.client.get(self.url, {'sort': 'num_expenses'}).content.decode()
+        self.assertLess(content.index('account2'), content.index('account1'))
+
+    def test_constant_query_count(self):
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        num_queries = len(ctx.captured_queries)
+
+        for i in range(3, 10):
+            Account.objects.create(budget=self.budget, name=f'account{i}', start_balance=1000)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        self.assertEqual(num_queries, len(ctx.captured_queries))
+
 
 class ExpenseDetailsView(WebTest, BudgetSetup, InstanceCrudSuite):
     def setUp(self):
@@ -388,6 +623,288 @@ class ExpensesTableViewTest(TestCase, BudgetSetup):
         for inst in self.model_class.objects.filter(budget=self.budget):
             self.assertIn(str(inst), resp.content.decode())
 
+    def test_constant_number_of_queries(self):
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+
+        account = Account.objects.create(budget=self.budget, name='account2', start_balance=1000)
+        for i in range(5):
+            Expense.objects.create(
+                name=f'Foobar{i + 3}', budget=self.budget, created=datetime.date.today(), amount=i, author=self.rw_user,
+                account=account, category=Category.objects.create(name=f'cat{i + 2}', budget=self.budget),
+            )
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            resp = self.client.get(self.url)
+
+        content = resp.content.decode()
+        self.assertIn('4.00 $', content)
+        self.assertIn(self.rw_user.username, content)
+        self.assertIn(reverse('budgets:category_details', args=(self.budget.id, self.budget.category_set.last().id)),
+                      content)
+
+    @override_settings(EXPENSES_PAGE_SIZE=1)
+    def test_pagination(self):
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        resp = self.client.get(self.url)
+        self.assertEqual(['Foobar2'], [e.name for e in resp.context['table'].data])
+        next_url = resp.context['pager']['next_url']
+
+        resp = self.client.get(self.url + next_url)
+        self.assertEqual(['Foobar1'], [e.name for e in resp.context['table'].data])
+        self.assertIsNone(resp.context['pager'].get('next_url'))
+        self.assertIsNotNone(resp.context['pager']['first_url'])
+
+    @override_settings(DASHBOARD_RECENT_EXPENSES=1)
+    def test_dashboard_recent_expenses(self):
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        resp = self.client.get(reverse('budgets:dashboard', kwargs={'bid': self.budget.id}))
+        self.assertEqual(['Foobar2'], [e.name for e in resp.context['expense_table'].data])
+        self.assertEqual(self.url, resp.context['expense_table_pager']['next_url'])
+
+
+class ExpenseBulkEditViewTest(TestCase, BudgetSetup):
+    def setUp(self):
+        self.prepare_budget()
+        self.a1 = Account.objects.create(budget=self.budget, name='a1', start_balance=1000)
+        self.a2 = Account.objects.create(budget=self.budget, name='a2', start_balance=1000)
+        self.food = Category.objects.create(name='food', budget=self.budget)
+        self.rent = Category.objects.create(name='rent', budget=self.budget)
+        self.expenses = [
+            Expense.objects.create(name=f'e{i}', budget=self.budget, account=self.a1, category=self.food,
+                                   created=datetime.date(2023, 1, i), amount=10)
+            for i in range(1, 4)
+        ]
+        self.url = reverse('budgets:expenses_bulk_edit', kwargs={'bid': self.budget.id})
+
+    def test_selection(self):
+        self.client.login(username=self.rw_user.username, password=USER_PASSWORD)
+        content = self.client.get(reverse('budgets:expenses_table', kwargs={'bid': self.budget.id})).content.decode()
+        self.assertIn('id="bulk-edit"', content)
+        self.assertIn(f'form="bulk-edit" name="expenses" value="{self.expenses[0].id}"', content)
+
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+        content = self.client.get(reverse('budgets:expenses_table', kwargs={'bid': self.budget.id})).content.decode()
+        self.assertNotIn('bulk-edit', content)
+
+    def test_bulk_edit(self):
+        self.client.login(username=self.rw_user.username, password=USER_PASSWORD)
+        ids = [e.id for e in self.expenses[:2]]
+        resp = self.client.post(self.url, {'expenses': ids, 'category': self.rent.id, 'account': self.a2.id},
+                                follow=True)
+        self.assertIn('EXPENSES_UPDATED: 2', resp.content.decode())
+        self.assertEqual({(self.a2.id, self.rent.id)}, set(
+            Expense.objects.filter(id__in=ids).values_list('account_id', 'category_id')
+        ))
+        self.assertEqual(980, Account.objects.get(id=self.a2.id).current_balance)
+        self.assertEqual({self.rw_user.id}, set(ExpenseModification.objects.values_list('updated_by', flat=True)))
+
+    def test_invalid_bulk_edit(self):
+        self.client.login(username=self.rw_user.username, password=USER_PASSWORD)
+        other = Budget.objects.create(name='budget2')
+        expense = Expense.objects.create(name='x', budget=other, amount=1)
+        other_category = Category.objects.create(name='c', budget=other)
+        for data in ({'expenses': [self.expenses[0].id]}, {'expenses': [expense.id], 'category': self.rent.id},
+                     {'expenses': [self.expenses[0].id], 'category': other_category.id}):
+            resp = self.client.post(self.url, data, follow=True)
+            self.assertIn('EXPENSE_UPDATE_FAILED', resp.content.decode())
+        self.assertEqual(0, ExpenseModification.objects.count())
+
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+        resp = self.client.post(self.url, {'expenses': [self.expenses[0].id], 'category': self.rent.id})
+        self.assertEqual(403, resp.status_code)
+
+
+class TablesBenchmarkTest(TestCase):
+    def test_benchmark(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            call_command('benchtables', rows=10, repeat=1)
+        self.assertIn('ExpensesTable (10 rows)', out.getvalue())
+        self.assertIn('AccountsTable (10 rows)', out.getvalue())
+
+
+class ViewsBenchmarkTest(TestCase):
+    def test_query_budgets(self):
+        # fails as soon as a view issues more queries than recorded in budgets/res/view_budgets.json
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results_file = os.path.join(tmp_dir, 'results.json')
+            with redirect_stdout(io.StringIO()):
+                call_command('benchviews', repeat=1, queries_only=True, json=results_file)
+            with open(results_file) as f:
+                results = json.load(f)['views']
+
+        self.assertIn('budgets:expenses_table', results)
+        self.assertIn('common:translation_bundle', results)
+        self.assertIn('users:details', results)
+        for name, result in results.items():
+            self.assertEqual([], result['violations'], name)
+            self.assertLess(result['status'], 400, name)
+
+
+class ExpenseExportViewTest(TestCase, BudgetSetup):
+    def setUp(self):
+        self.prepare_budget()
+        self.a1 = Account.objects.create(budget=self.budget, name='a1', start_balance=1000)
+        self.a2 = Account.objects.create(budget=self.budget, name='a2', start_balance=1000)
+        self.food = Category.objects.create(name='food', budget=self.budget)
+        self.fruit = Category.objects.create(name='fruit', budget=self.budget, parent=self.food)
+        self.rent = Category.objects.create(name='rent', budget=self.budget)
+        for name, account, category, day in (('apples', self.a1, self.fruit, 1), ('bread', self.a2, self.food, 2),
+                                             ('flat', self.a1, self.rent, 3)):
+            Expense.objects.create(name=name, budget=self.budget, account=account, category=category,
+                                   created=datetime.date(2023, 1, day), amount=day * 10, author=self.owner,
+                                   note='a & <b>')
+        self.url = reverse('budgets:expenses_export', kwargs={'bid': self.budget.id})
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+
+    def export(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content)
+
+    def csv_names(self, **params):
+        lines = self.export(**params).decode().splitlines()
+        return [line.split(';')[1] for line in lines[1:]]
+
+    def test_csv(self):
+        lines = self.export().decode().splitlines()
+        self.assertEqual('CREATION_DATE;NAME;AMOUNT;ACCOUNT;CATEGORY;AUTHOR;EXTERNAL_REFERENCE;NOTE', lines[0])
+        self.assertEqual('2023-01-01;apples;10.0;a1;fruit;user1;;a & <b>', lines[1])
+        self.assertEqual(4, len(lines))
+
+    def test_filters(self):
+        self.assertEqual(['apples', 'flat'], self.csv_names(account=self.a1.id))
+        self.assertEqual(['apples', 'bread'], self.csv_names(category=self.food.id))
+        self.assertEqual(['bread', 'flat'], self.csv_names(start='2023-01-02', end='2023-01-03'))
+
+        other = Budget.objects.create(name='budget2')
+        account = Account.objects.create(budget=other, name='a1')
+        self.assertEqual(404, self.client.get(self.url, {'account': account.id}).status_code)
+        self.assertEqual(400, self.client.get(self.url, {'format': 'pdf'}).status_code)
+
+    def test_xlsx(self):
+        content = self.export(format='xlsx')
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            self.assertIn('xl/workbook.xml', workbook.namelist())
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('s:sheetData/s:row', ns)
+        self.assertEqual(4, len(rows))
+        cells = rows[1].findall('s:c', ns)
+        self.assertEqual('apples', cells[1].find('s:is/s:t', ns).text)
+        self.assertEqual('10.0', cells[2].find('s:v', ns).text)
+        self.assertEqual('a & <b>', cells[7].find('s:is/s:t', ns).text)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'expenses.csv')
+            call_command('exportexpenses', path, budget=self.budget.id, category=self.food.id)
+            with open(path) as f:
+                self.assertEqual(3, len(f.read().splitlines()))
+
+
+class ExpenseImportViewTest(WebTest, BudgetSetup):
+    def setUp(self):
+        self.prepare_budget()
+        self.account = Account.objects.create(budget=self.budget, name='a1', start_balance=1000)
+        self.locked = Account.objects.create(budget=self.budget, name='a2', start_balance=1000, locked=True)
+        self.url = reverse('budgets:expenses_import', kwargs={'bid': self.budget.id})
+        self.statement = b'date;name;amount;reference\n2023-01-05;Bakery;12.50;R1\n2023-01-06;Fuel;40;R2\n'
+
+    def upload(self, user, filename, content, status=302):
+        form = self.app.get(self.url, user=user).form
+        form['account'] = self.account.id
+        form['file'] = (filename, content)
+        return form.submit(status=status)
+
+    def test_import(self):
+        resp = self.upload(self.rw_user, 'statement.csv', self.statement).follow()
+        self.assertIn('EXPENSES_IMPORTED: 2, DUPLICATES_SKIPPED: 0, ROWS_SKIPPED: 0', resp.content.decode())
+        self.assertEqual({self.rw_user}, {e.author for e in Expense.objects.filter(account=self.account)})
+
+        resp = self.upload(self.owner, 'statement.csv', self.statement).follow()
+        self.assertIn('EXPENSES_IMPORTED: 0, DUPLICATES_SKIPPED: 2, ROWS_SKIPPED: 0', resp.content.decode())
+        self.assertEqual(947.5, Account.objects.get(id=self.account.id).current_balance)
+
+    def test_invalid_upload(self):
+        resp = self.upload(self.rw_user, 'statement.pdf', self.statement, status=200)
+        self.assertIn('UNKNOWN_STATEMENT_FORMAT', resp.content.decode())
+        self.assertEqual(0, Expense.objects.count())
+
+        form = self.app.get(self.url, user=self.rw_user).form
+        self.assertNotIn(str(self.locked.id), [value for value, _, _ in form['account'].options])
+
+    def test_permissions(self):
+        self.assertEqual(403, self.app.get(self.url, user=self.ro_user, status='*').status_code)
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+        resp = self.client.post(self.url, {'account': self.account.id, 'file': io.BytesIO(self.statement)})
+        self.assertEqual(403, resp.status_code)
+        self.assertEqual(0, Expense.objects.count())
+
+
+class LookupViewTest(TestCase, BudgetSetup):
+    def setUp(self):
+        self.prepare_budget()
+        for name in ('Food', 'Fuel', 'Seafood', 'Rent'):
+            Category.objects.create(name=name, budget=self.budget)
+        self.other = Budget.objects.create(name='budget2')
+        Category.objects.create(name='Fun', budget=self.other)
+        cache.clear()
+
+    def lookup(self, channel, term, budget=None, status=200):
+        params = {'term': term}
+        if budget:
+            params['budget'] = budget.id
+        resp = self.client.get(reverse('ajax_lookup', kwargs={'channel': channel}), params)
+        self.assertEqual(status, resp.status_code)
+        return [item['value'] for item in resp.json()] if status == 200 else None
+
+    def test_categories(self):
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+        # prefix matches come first
+        self.assertEqual(['Food', 'Fuel', 'Seafood'], self.lookup('categories', 'f', self.budget))
+        self.assertEqual(['Food', 'Seafood'], self.lookup('categories', 'foo', self.budget))
+        self.lookup('categories', 'f', status=403)
+        self.lookup('categories', 'f', self.other, status=403)
+
+    def test_category_cache(self):
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+        self.lookup('categories', 'fu', self.budget)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(['Fuel'], self.lookup('categories', 'FU', self.budget))
+        self.assertFalse([q for q in ctx.captured_queries if 'budgets_category' in q['sql']])
+        resp = self.client.get(reverse('ajax_lookup', kwargs={'channel': 'categories'}),
+                               {'term': 'fu', 'budget': self.budget.id})
+        self.assertEqual(str(Category.objects.get(name='Fuel').id), resp.json()[0]['pk'])
+
+        Category.objects.create(name='Furniture', budget=self.budget)
+        self.assertEqual(['Fuel', 'Furniture'], self.lookup('categories', 'fu', self.budget))
+
+    def test_users(self):
+        self.client.login(username=self.rw_user.username, password=USER_PASSWORD)
+        self.lookup('user_read_access', 'user', self.budget, status=403)
+
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        self.assertEqual(['user1', 'user2', 'user3'], self.lookup('user_read_access', 'user', self.budget))
+        User.objects.create_user(username='user4', password=USER_PASSWORD)
+        self.assertEqual(['user1', 'user2', 'user3', 'user4'], self.lookup('user_write_access', 'user', self.budget))
+        self.assertEqual([], self.lookup('user_write_access', 'ser', self.budget))
+
+        # the cache keeps ids and names only
+        users = User.objects.filter(username__startswith='user').order_by('username')
+        self.assertEqual([(u.id, u.username) for u in users],
+                         cache.get(UserReadAccessLookup().cache_key('user', self.budget)))
+
+    def test_anonymous(self):
+        # a budget without owner must not be readable either
+        for channel in ('categories', 'user_read_access', 'user_write_access'):
+            self.lookup(channel, 'f', self.budget, status=403)
+            self.lookup(channel, 'f', self.other, status=403)
+
 
 class CategoryAddViewTest(WebTest, BudgetSetup, InstanceCrudSuite):
     def setUp(self):
@@ -509,3 +1026,68 @@ class BudgetEditView(WebTest, BudgetSetup, InstanceCrudSuite):
 
     def test_invalid_modifications_as_owner(self):
         self.check_modifications(self.invalid_modifications, self.owner, self.error_message)
+
+
+class BudgetViewPermissionTest(TestCase, BudgetSetup):
+    def setUp(self):
+        self.prepare_budget()
+        self.account = Account.objects.create(budget=self.budget, name='account1', start_balance=1000)
+        self.category = Category.objects.create(name='cat1', budget=self.budget)
+        self.expense = Expense.objects.create(
+            name='Foobar1', budget=self.budget, category=self.category, created=datetime.date.today(),
+            amount=120, author=self.owner, account=self.account,
+        )
+        kwargs = {'bid': self.budget.id}
+        self.read_urls = [
+            reverse('budgets:dashboard', kwargs=kwargs),
+            reverse('budgets:dashboard_data', kwargs=kwargs),
+            reverse('budgets:expenses_table', kwargs=kwargs),
+            reverse('budgets:accounts_table', kwargs=kwargs),
+            reverse('budgets:categories_table', kwargs=kwargs),
+            reverse('budgets:expense_details', kwargs={**kwargs, 'eid': self.expense.id}),
+        ]
+        self.write_urls = [
+            reverse('budgets:accounts_add', kwargs=kwargs),
+            reverse('budgets:categories_add', kwargs=kwargs),
+            reverse('budgets:expenses_add', kwargs=kwargs),
+        ]
+
+    def check_queries(self, url, exp_status_code):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(exp_status_code, resp.status_code, url)
+
+        budget_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "budgets_budget"' in q['sql']]
+        access_queries = [q['sql'] for q in ctx.captured_queries if '_access"' in q['sql']]
+        self.assertEqual(1, len(budget_queries), url)
+        self.assertEqual(budget_queries, access_queries, url)
+        self.assertIn('EXISTS', budget_queries[0])
+
+    def test_single_budget_and_permission_query(self):
+        self.client.login(username=self.ro_user.username, password=USER_PASSWORD)
+        for url in self.read_urls:
+            self.check_queries(url, 200)
+        for url in self.write_urls + [reverse('budgets:edit', kwargs={'bid': self.budget.id})]:
+            self.check_queries(url, 403)
+
+        self.client.login(username=self.rw_user.username, password=USER_PASSWORD)
+        for url in self.read_urls + self.write_urls:
+            self.check_queries(url, 200)
+
+    def test_objects_of_other_budgets(self):
+        other = Budget.objects.create(name='budget2', owner=self.owner)
+        self.client.login(username=self.owner.username, password=USER_PASSWORD)
+        for name, kwargs in (('account_details', {'aid': self.account.id}),
+                             ('expense_details', {'eid': self.expense.id}),
+                             ('category_details', {'cid': self.category.id})):
+            resp = self.client.get(reverse(f'budgets:{name}', kwargs={'bid': other.id, **kwargs}))
+            self.assertEqual(404, resp.status_code, name)
+
+    def test_anonymous_user(self):
+        orphan = Budget.objects.create(name='budget2')
+        self.assertEqual(set(), orphan.permissions(AnonymousUser()))
+        self.assertEqual(set(), Budget.objects.with_permissions(AnonymousUser()).get(id=orphan.id).permissions(
+            AnonymousUser()
+        ))
+        self.assertEqual({'read', 'write', 'owner'}, self.budget.permissions(self.owner))
@@ -2,7 +2,8 @@ from django.urls import path
 
 from budgets.views import DashboardView, AccountAddView, AccountsTableView, ExpensesTableView, ExpenseAddView, \
     ExpenseDetailsView, DashboardDataView, AccountsDetailsView, CategoryAddView, CategoryDetailsView, \
-    CategoriesTableView, BudgetEditView
+    CategoriesTableView, BudgetEditView, ReportView, ReportDataView, ExpenseExportView, \
+    ExpenseImportView, ExpenseBulkEditView
 
 urlpatterns = [
     path('<int:bid>/edit', BudgetEditView.as_view(), name='edit'),
@@ -10,6 +11,9 @@ urlpatterns = [
     path('<int:bid>/dashboard', DashboardView.as_view(), name='dashboard'),
     path('<int:bid>/dashboard/data', DashboardDataView.as_view(), name='dashboard_data'),
 
+    path('<int:bid>/reports', ReportView.as_view(), name='reports'),
+    path('<int:bid>/reports/data', ReportDataView.as_view(), name='report_data'),
+
     path('<int:bid>/accounts/add', AccountAddView.as_view(), name='accounts_add'),
     path('<int:bid>/accounts/all', AccountsTableView.as_view(), name='accounts_table'),
     path('<int:bid>/accounts/<int:aid>', AccountsDetailsView.as_view(), name='account_details'),
@@ -20,5 +24,8 @@ urlpatterns = [
 
     path('<int:bid>/expenses/add', ExpenseAddView.as_view(), name='expenses_add'),
     path('<int:bid>/expenses/all', ExpensesTableView.as_view(), name='expenses_table'),
+    path('<int:bid>/expenses/bulk', ExpenseBulkEditView.as_view(), name='expenses_bulk_edit'),
+    path('<int:bid>/expenses/import', ExpenseImportView.as_view(), name='expenses_import'),
+    path('<int:bid>/expenses/export', ExpenseExportView.as_view(), name='expenses_export'),
     path('<int:bid>/expenses/<int:eid>', ExpenseDetailsView.as_view(), name='expense_details'),
 ]
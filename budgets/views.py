@@ -1,27 +1,40 @@
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse, HttpResponse
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
 from django.urls import reverse
 from django.utils import formats
 from django.utils.datetime_safe import datetime
 from django.utils.decorators import method_decorator
+from django_tables2 import RequestConfig
 
-from budgets.forms import AccountForm, ExpenseForm, CategoryForm, BudgetEditForm
+from budgets.distribution import spending_distribution
+from budgets.export import export_expenses, EXPORT_FORMATS
+from budgets.forms import AccountForm, ExpenseForm, CategoryForm, BudgetEditForm, DistributionFilterForm, \
+    ReportFilterForm, ExportFilterForm, ExpenseImportForm, ExpenseBulkEditForm
+from budgets.history import balance_history
 from budgets.models import Budget, Account, Expense, Category, ExpenseModification
-from budgets.tables import BalancesTable, ExpensesTable, AccountsTable, CategoriesTable, ExpenseModificationsTable
+from budgets.pagination import keyset_page
+from budgets.reports import build_report
+from budgets.statements import import_statement
+from budgets.tables import BalancesTable, ExpensesTable, AccountsTable, CategoriesTable, ExpenseModificationsTable, \
+    ReportTable, SelectableExpensesTable
 from common.models import TranslationEntry
 from common.views import AuthenticatedUserView, common_ctx, formpage_ctx
 
 
 def build_budget_edit_form(request, budget):
-    return BudgetEditForm(
+    form = BudgetEditForm(
         instance=budget,
         data=request.POST if request.POST else None,
     )
+    for field, channel in (('read_access', 'user_read_access'), ('write_access', 'user_write_access')):
+        ajax_url = '{}?budget={}'.format(reverse('ajax_lookup', kwargs={'channel': channel}), budget.id)
+        form.fields[field].widget.plugin_options['source'] = ajax_url
+    return form
 
 
 def build_account_form(request, budget, instance=None):
@@ -57,6 +70,24 @@ def build_expense_form(request, budget, instance=None):
     return form
 
 
+def build_import_form(request, budget):
+    form = ExpenseImportForm(
+        data=request.POST if request.POST else None,
+        files=request.FILES if request.POST else None,
+    )
+    form.fields['account'].queryset = Account.objects.filter(budget=budget, locked=False).order_by('name')
+    form.fields['category'].queryset = Category.objects.filter(budget=budget).order_by('name')
+    return form
+
+
+def build_bulk_edit_form(request, budget):
+    form = ExpenseBulkEditForm(data=request.POST if request.POST else None)
+    form.fields['expenses'].queryset = Expense.objects.filter(budget=budget)
+    form.fields['category'].queryset = Category.objects.filter(budget=budget).order_by('name')
+    form.fields['account'].queryset = Account.objects.filter(budget=budget, locked=False).order_by('name')
+    return form
+
+
 def build_category_form(request, budget, instance=None):
     form = CategoryForm(
         instance=instance,
@@ -65,7 +96,7 @@ def build_category_form(request, budget, instance=None):
     category_choices = [(None, None)] + [
         (c.id, c.name)
         for c in Category.objects.filter(budget=budget).order_by('name')
-        if instance is None or c != instance
+        if instance is None or instance.is_valid_parent(c)
     ]
     form.fields['parent'].choices = category_choices
     form.fields['parent'].widget.choices = category_choices
@@ -73,19 +104,31 @@ def build_category_form(request, budget, instance=None):
     return form
 
 
-def permission_check(budget, user, permission):
-    param = f'{permission}_access'
-    return user.is_superuser or user == budget.owner or user in getattr(budget, param).all()
+def build_expenses_table(request, expenses, table_class=ExpensesTable):
+    rows, next_cursor = keyset_page(expenses, request.GET.get('after'), settings.EXPENSES_PAGE_SIZE)
+    params = request.GET.copy()
+    params.pop('after', None)
+    pager = {'first_url': f'?{params.urlencode()}' if 'after' in request.GET else None}
+    if next_cursor:
+        params['after'] = next_cursor
+        pager['next_url'] = f'?{params.urlencode()}'
+    return table_class(rows), pager
 
 
 class BudgetView(AuthenticatedUserView):
     @method_decorator(login_required)
     def dispatch(self, request, *args, **kwargs):
-        budget = get_object_or_404(Budget, id=kwargs['bid'])
-        if permission_check(budget, request.user, 'read'):
+        # the budget and the permissions of the user are resolved once per request
+        request.budget = get_object_or_404(Budget.objects.with_permissions(request.user), id=kwargs['bid'])
+        request.budget_permissions = request.budget.permissions(request.user)
+        if 'read' in request.budget_permissions:
             return super(BudgetView, self).dispatch(request, *args, **kwargs)
         raise PermissionDenied(TranslationEntry.get('PERMISSION_DENIED'))
 
+    def require_permission(self, request, permission):
+        if permission not in request.budget_permissions:
+            raise PermissionDenied()
+
 
 class BudgetSelectView(AuthenticatedUserView):
     def get(self, request):
@@ -94,14 +137,25 @@ class BudgetSelectView(AuthenticatedUserView):
 
 class DashboardView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
+        budget = request.budget
+        balance_table = BalancesTable(
+            Account.objects.filter(budget=budget, locked=False).with_balances().order_by('name')
+        )
+        RequestConfig(request, paginate=False).configure(balance_table)
+        recent, next_cursor = keyset_page(
+            Expense.objects.filter(budget=budget).table_rows(), None, settings.DASHBOARD_RECENT_EXPENSES
+        )
         ctx = {
             **common_ctx(request, budget),
             'title': 'Dashboard',
-            'balance_table': BalancesTable(Account.objects.filter(budget=budget, locked=False).order_by('name')),
+            'balance_table': balance_table,
             'balance_table_title': TranslationEntry.get('BALANCE'),
-            'expense_table': ExpensesTable(Expense.objects.filter(budget=budget).order_by('-created')),
+            'expense_table': ExpensesTable(recent),
             'expense_table_title': TranslationEntry.get('EXPENSES'),
+            'expense_table_pager': {
+                'next_url': reverse('budgets:expenses_table', args=(budget.id,)),
+                'next_label': 'SHOW_ALL',
+            } if next_cursor else None,
         }
 
         return render(request, 'budgets/dashboard/dashboard.html', ctx)
@@ -109,42 +163,43 @@ class DashboardView(BudgetView):
 
 class DashboardDataView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
+        budget = request.budget
+        dist_filter = DistributionFilterForm(data=request.GET)
+        if not dist_filter.is_valid():
+            return JsonResponse({'errors': dist_filter.errors}, status=400)
         return JsonResponse({
             'stats': self.get_stats_data(budget),
-            'charts': self.get_chart_data(budget)
+            'charts': self.get_chart_data(budget, dist_filter.cleaned_data)
         })
 
     def get_stats_data(self, budget):
-        accounts = Account.objects.filter(budget=budget, locked=False)
-        expenses = sum([e.amount for e in Expense.objects.filter(account__in=accounts)])
-        total_budget = sum([a.start_balance for a in accounts])
+        totals = Account.objects.filter(budget=budget, locked=False).totals()
+        expenses, total_budget = totals['expenses'], totals['total_budget']
         return {
             'expenses': formats.number_format(expenses, decimal_pos=2, use_l10n=True),
             'remaining_budget': formats.number_format(total_budget - expenses, decimal_pos=2, use_l10n=True),
             'total_budget': formats.number_format(total_budget, decimal_pos=2, use_l10n=True),
-            'num_accounts': len(accounts),
+            'num_accounts': totals['num_accounts'],
         }
 
-    def get_chart_data(self, budget):
+    def get_chart_data(self, budget, dist_filter):
         return {
             'history': self.get_history_data(budget),
-            'distribution': self.get_dist_data(budget),
+            'distribution': self.get_dist_data(budget, **dist_filter),
         }
 
-    def get_dist_data(self, budget):
-        return []
+    def get_dist_data(self, budget, category=None, start=None, end=None):
+        root = get_object_or_404(Category, id=category, budget=budget) if category else None
+        return {
+            'category': root.id if root else None,
+            'parent': root.parent_id if root else None,
+            'series': spending_distribution(budget, root, start, end),
+        }
 
     def get_history_data(self, budget):
-        series = []
-        accounts = Account.objects.filter(budget=budget, locked=False).order_by('id')
+        accounts = list(Account.objects.filter(budget=budget, locked=False).order_by('id'))
         account_names = [a.name for a in accounts]
-        expenses = Expense.objects.filter(account__in=accounts)
-        for e in expenses.order_by('created'):
-            entry = {'x': e.created.strftime('%Y/%m/%d'), 'expense': e.amount}
-            for a in accounts:
-                entry[f'acc_{a.id}'] = a.balance_at(e.created)
-            series.append(entry)
+        series = balance_history(accounts)
 
         lang = settings.LANGUAGE_CODE
         lang = lang.split('-')[0] if '-' in lang else lang
@@ -156,19 +211,41 @@ class DashboardDataView(BudgetView):
         }
 
 
+class ReportView(BudgetView):
+    def get(self, request, bid):
+        budget = request.budget
+        form = ReportFilterForm(data=request.GET)
+        report = build_report(budget, **form.cleaned_data) if form.is_valid() else None
+        ctx = {
+            **common_ctx(request, budget),
+            'title': TranslationEntry.get('REPORTS'),
+            'form': form,
+            'report': report,
+            'categories_table': ReportTable(report['categories']) if report else None,
+            'accounts_table': ReportTable(report['accounts']) if report else None,
+        }
+        return render(request, 'budgets/report.html', ctx)
+
+
+class ReportDataView(BudgetView):
+    def get(self, request, bid):
+        form = ReportFilterForm(data=request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse(build_report(request.budget, **form.cleaned_data))
+
+
 class AccountAddView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
         ctx = self.build_ctx(request, budget)
         return render(request, 'common/formpage.html', ctx)
 
     def post(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
         form = build_account_form(request, budget)
         valid = form.is_valid()
@@ -195,16 +272,15 @@ class AccountAddView(BudgetView):
 
 class AccountsDetailsView(BudgetView):
     def get(self, request, bid, aid):
-        budget = get_object_or_404(Budget, id=bid)
-        account = get_object_or_404(Account, id=aid)
+        budget = request.budget
+        account = get_object_or_404(Account, id=aid, budget=budget)
         ctx = self.build_ctx(request, budget, account)
         return render(request, 'budgets/account.html', ctx)
 
     def post(self, request, bid, aid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
-        account = get_object_or_404(Account, id=aid)
+        budget = request.budget
+        self.require_permission(request, 'write')
+        account = get_object_or_404(Account, id=aid, budget=budget)
 
         form = build_account_form(request, budget, account)
         if form.is_valid():
@@ -224,23 +300,24 @@ class AccountsDetailsView(BudgetView):
         return render(request, 'budgets/account.html', ctx)
 
     def delete(self, request, bid, aid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
-        account = get_object_or_404(Account, id=aid)
+        account = get_object_or_404(Account, id=aid, budget=budget)
         account.delete()
         messages.success(request, TranslationEntry.get('ACCOUNT_DELETED'))
         return HttpResponse()
 
     def build_ctx(self, request, budget, account, form=None):
         used_form = form or build_account_form(request, budget, account)
-        expenses = Expense.objects.filter(account=account).order_by('-created')
+        expenses = Expense.objects.filter(account=account)
+        table, pager = build_expenses_table(request, expenses.table_rows())
         return {
             'title': account.name,
             'table_title': TranslationEntry.get('EXPENSES'),
-            'table': ExpensesTable(expenses),
-            'spent': sum(expenses.values_list('amount', flat=True)),
+            'table': table,
+            'pager': pager,
+            'spent': expenses.totals()['amount'],
             'locked': account.locked,
             'remaining': account.balance_at(datetime.now()),
             **formpage_ctx(request, budget, used_form, reverse('budgets:account_details', args=(budget.id, account.id)))
@@ -249,9 +326,11 @@ class AccountsDetailsView(BudgetView):
 
 class AccountsTableView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
+        budget = request.budget
+        table = AccountsTable(Account.objects.filter(budget=budget).with_balances().order_by('name'))
+        RequestConfig(request, paginate=False).configure(table)
         ctx = {
-            'table': AccountsTable(Account.objects.filter(budget=budget).order_by('name')),
+            'table': table,
             'title': TranslationEntry.get('ACCOUNTS', 'de'),
             **common_ctx(request, budget),
         }
@@ -260,16 +339,14 @@ class AccountsTableView(BudgetView):
 
 class ExpenseAddView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
         ctx = self.build_ctx(request, budget)
         return render(request, 'common/formpage.html', ctx)
 
     def post(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
         form = build_expense_form(request, budget)
         if form.is_valid():
@@ -295,20 +372,19 @@ class ExpenseAddView(BudgetView):
 
 class ExpenseDetailsView(BudgetView):
     def get(self, request, bid, eid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'read'):
-            raise PermissionDenied()
+        budget = request.budget
 
-        expense = get_object_or_404(Expense, id=eid)
+        # the related objects are needed by the form
+        expense = get_object_or_404(Expense.objects.select_related('account', 'category'), id=eid, budget=budget)
         ctx = self.build_ctx(request, budget, expense)
         return render(request, 'budgets/expense.html', ctx)
 
     def post(self, request, bid, eid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
-        expense = get_object_or_404(Expense, id=eid)
+        # the related objects are needed by the form and the history of the expense
+        expense = get_object_or_404(Expense.objects.select_related('account', 'category'), id=eid, budget=budget)
         form = build_expense_form(request, budget, expense)
         if form.is_valid():
             expense = form.save(commit=False)
@@ -322,11 +398,10 @@ class ExpenseDetailsView(BudgetView):
         return render(request, 'budgets/expense.html', ctx)
 
     def delete(self, request, bid, eid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
-        expense = get_object_or_404(Expense, id=eid)
+        expense = get_object_or_404(Expense, id=eid, budget=budget)
         expense.delete()
         messages.success(request, TranslationEntry.get('EXPENSE_DELETED'))
         return HttpResponse()
@@ -347,28 +422,110 @@ class ExpenseDetailsView(BudgetView):
 
 class ExpensesTableView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
+        budget = request.budget
+        can_write = 'write' in request.budget_permissions
+        table, pager = build_expenses_table(
+            request,
+            Expense.objects.filter(budget=budget).table_rows(),
+            SelectableExpensesTable if can_write else ExpensesTable,
+        )
         ctx = {
             **common_ctx(request, budget),
-            'table': ExpensesTable(Expense.objects.filter(budget=budget).order_by('-created')),
+            'table': table,
+            'pager': pager,
             'title': TranslationEntry.get('EXPENSES'),
+            'form': build_bulk_edit_form(request, budget) if can_write else None,
+            'url': reverse('budgets:expenses_bulk_edit', args=(budget.id,)),
+        }
+        return render(request, 'budgets/expenses.html', ctx)
+
+
+class ExpenseBulkEditView(BudgetView):
+    def post(self, request, bid):
+        budget = request.budget
+        self.require_permission(request, 'write')
+
+        form = build_bulk_edit_form(request, budget)
+        if not form.is_valid():
+            messages.error(request, TranslationEntry.get('EXPENSE_UPDATE_FAILED'))
+            return redirect('budgets:expenses_table', bid=budget.id)
+
+        changes = {field: form.cleaned_data[field] for field in ('category', 'account') if form.cleaned_data[field]}
+        try:
+            count = form.cleaned_data['expenses'].audited_update(request.user, **changes)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+        else:
+            messages.success(request, f'{TranslationEntry.get("EXPENSES_UPDATED")}: {count}')
+        return redirect('budgets:expenses_table', bid=budget.id)
+
+
+class ExpenseExportView(BudgetView):
+    def get(self, request, bid):
+        budget = request.budget
+        form = ExportFilterForm(data=request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        params = form.cleaned_data
+        account = get_object_or_404(Account, id=params['account'], budget=budget) if params['account'] else None
+        category = get_object_or_404(Category, id=params['category'], budget=budget) if params['category'] else None
+        export_format = params['format'] or 'csv'
+        stream, content_type = EXPORT_FORMATS[export_format]
+
+        rows = export_expenses(budget, account, category, params['start'], params['end'])
+        response = StreamingHttpResponse(stream(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="expenses_{budget.id}.{export_format}"'
+        return response
+
+
+class ExpenseImportView(BudgetView):
+    def get(self, request, bid):
+        budget = request.budget
+        self.require_permission(request, 'write')
+        ctx = self.build_ctx(request, budget)
+        return render(request, 'common/formpage.html', ctx)
+
+    def post(self, request, bid):
+        budget = request.budget
+        self.require_permission(request, 'write')
+
+        form = build_import_form(request, budget)
+        if not form.is_valid():
+            messages.error(request, TranslationEntry.get('EXPENSE_IMPORT_FAILED'))
+            return render(request, 'common/formpage.html', self.build_ctx(request, budget, form))
+
+        params = form.cleaned_data
+        result = import_statement(params['file'], params['format'], params['account'], params['category'],
+                                  request.user)
+        messages.success(request, '{}: {}, {}: {}, {}: {}'.format(
+            TranslationEntry.get('EXPENSES_IMPORTED'), result['created'],
+            TranslationEntry.get('DUPLICATES_SKIPPED'), result['duplicates'],
+            TranslationEntry.get('ROWS_SKIPPED'), result['skipped'],
+        ))
+        if result['error']:
+            messages.error(request, result['error'])
+        return redirect('budgets:expenses_table', bid=budget.id)
+
+    def build_ctx(self, request, budget, form=None):
+        used_form = form or build_import_form(request, budget)
+        return {
+            'title': TranslationEntry.get('IMPORT_EXPENSES'),
+            **formpage_ctx(request, budget, used_form, reverse('budgets:expenses_import', args=(budget.id,)))
         }
-        return render(request, 'common/tables/tablepage.html', ctx)
 
 
 class CategoryAddView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
         ctx = self.build_ctx(request, budget)
         return render(request, 'common/formpage.html', ctx)
 
     def post(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
         form = build_category_form(request, budget)
         if form.is_valid():
@@ -391,17 +548,16 @@ class CategoryAddView(BudgetView):
 
 class CategoryDetailsView(BudgetView):
     def get(self, request, bid, cid):
-        budget = get_object_or_404(Budget, id=bid)
-        category = get_object_or_404(Category, id=cid)
+        budget = request.budget
+        category = get_object_or_404(Category, id=cid, budget=budget)
         ctx = self.build_ctx(request, budget, category)
         return render(request, 'budgets/category.html', ctx)
 
     def post(self, request, bid, cid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
-        category = get_object_or_404(Category, id=cid)
+        category = get_object_or_404(Category, id=cid, budget=budget)
         form = build_category_form(request, budget, category)
         if form.is_valid():
             category = form.save(commit=False)
@@ -411,30 +567,28 @@ class CategoryDetailsView(BudgetView):
         else:
             messages.error(request, TranslationEntry.get('CATEGORY_UPDATE_FAILED'))
 
-        ctx = self.build_ctx(request, category, category, form)
+        ctx = self.build_ctx(request, budget, category, form)
         return render(request, 'budgets/category.html', ctx)
 
     def delete(self, request, bid, cid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not permission_check(budget, request.user, 'write'):
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'write')
 
-        category = get_object_or_404(Category, id=cid)
+        category = get_object_or_404(Category, id=cid, budget=budget)
         category.delete()
         messages.success(request, TranslationEntry.get('CATEGORY_DELETED'))
         return HttpResponse()
 
     def build_ctx(self, request, budget, category, form=None):
         used_form = form or build_category_form(request, budget, category)
-        categories = [category]
-        category.descendants(categories)
-        expenses = Expense.objects.filter(category__in=categories).order_by('-created')
+        expenses = category.subtree_expenses()
+        table, pager = build_expenses_table(request, expenses.table_rows())
         return {
             'title': category.name,
             'table_title': TranslationEntry.get('EXPENSES'),
-            'table': ExpensesTable(expenses),
-            'amount': sum([e.amount for e in expenses]),
-            'count': len(expenses),
+            'table': table,
+            'pager': pager,
+            **expenses.totals(),
             **formpage_ctx(request, budget, used_form,
                            reverse('budgets:category_details', args=(budget.id, category.id)))
         }
@@ -442,7 +596,7 @@ class CategoryDetailsView(BudgetView):
 
 class CategoriesTableView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
+        budget = request.budget
         ctx = {
             **common_ctx(request, budget),
             'table': CategoriesTable(Category.objects.filter(budget=budget).order_by('name')),
@@ -453,17 +607,15 @@ class CategoriesTableView(BudgetView):
 
 class BudgetEditView(BudgetView):
     def get(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not request.user.is_superuser and request.user != budget.owner:
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'owner')
 
         ctx = self.build_ctx(request, budget)
         return render(request, 'common/formpage.html', ctx)
 
     def post(self, request, bid):
-        budget = get_object_or_404(Budget, id=bid)
-        if not request.user.is_superuser and request.user != budget.owner:
-            raise PermissionDenied()
+        budget = request.budget
+        self.require_permission(request, 'owner')
 
         form = build_budget_edit_form(request, budget)
         if form.is_valid():
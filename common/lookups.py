@@ -1,14 +1,95 @@
+import hashlib
+from collections import namedtuple
+from uuid import uuid4
+
 from ajax_select import LookupChannel
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+from budgets.models import Budget
+
+LOOKUP_VERSION_KEY = 'common:lookup_version:{}'
+LOOKUP_CACHE_TIMEOUT = 60
+LOOKUP_LIMIT = 50
+
+
+class LookupItem(namedtuple('LookupItem', ['id', 'display'])):
+    # cached lookup result, renders like the model instance without keeping its other fields
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.display
+
+
+def lookup_version(scope):
+    key = LOOKUP_VERSION_KEY.format(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_lookups(scope):
+    cache.set(LOOKUP_VERSION_KEY.format(scope), uuid4().hex, timeout=None)
 
 
 class ItemLookup(LookupChannel):
     model = None
     filter_field = None
     suffix = 'write'
+    # permission the user needs on the budget given by the budget parameter
+    permission = 'read'
+    # scans the remaining candidates for inner matches if there are too few prefix matches
+    contains_fallback = False
+
+    def check_auth(self, request):
+        # the lookup URLs do not require a login
+        if not request.user.is_authenticated:
+            raise PermissionDenied()
+        try:
+            budget_id = int(request.GET.get('budget') or request.POST.get('budget'))
+        except (TypeError, ValueError):
+            raise PermissionDenied()
+
+        budget = Budget.objects.with_permissions(request.user).filter(id=budget_id).first()
+        if budget is None or self.permission not in budget.permissions(request.user):
+            raise PermissionDenied()
+        request.budget = budget
+
+    def cache_scope(self, budget):
+        return self.model._meta.model_name
+
+    def get_candidates(self, budget):
+        return self.model.objects.all()
+
+    def search(self, q, budget):
+        candidates = self.get_candidates(budget).order_by(self.filter_field)
+        items = list(candidates.filter(**{f'{self.filter_field}__istartswith': q})[:LOOKUP_LIMIT])
+        if self.contains_fallback and len(items) < LOOKUP_LIMIT:
+            items += candidates.filter(**{f'{self.filter_field}__icontains': q}).exclude(
+                **{f'{self.filter_field}__istartswith': q}
+            )[:LOOKUP_LIMIT - len(items)]
+        return items
+
+    def cache_key(self, q, budget):
+        scope = self.cache_scope(budget)
+        return 'common:lookup:{}:{}:{}:{}'.format(
+            scope, lookup_version(scope), budget.id, hashlib.md5(q.strip().lower().encode()).hexdigest()
+        )
 
     def get_query(self, q, request):
-        filter_param = {f'{self.filter_field}__contains': q}
-        return self.model.objects.filter(**filter_param).order_by(self.filter_field)[:50]
+        # only ids and display values are cached, never whole rows like the password hashes of users
+        key = self.cache_key(q, request.budget)
+        items = cache.get(key)
+        if items is None:
+            items = [(item.id, str(item)) for item in self.search(q.strip(), request.budget)]
+            cache.set(key, items, timeout=LOOKUP_CACHE_TIMEOUT)
+        return [LookupItem(*item) for item in items]
 
     def format_item_display(self, item):
         onclick = f'document.getElementById(\'kill_{item.id}id_{self.suffix}\').click()'
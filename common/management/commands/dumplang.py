@@ -1,3 +1,5 @@
+import csv
+
 from django.core.management.base import BaseCommand
 
 from common.models import TranslationEntry
@@ -13,9 +15,14 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         filter_args = {'lang': options['lang']} if options['lang'] else {}
         count = 0
-        with open(options['outfile'], 'w') as fh:
-            fh.write('name;lang;text\n')
-            for te in TranslationEntry.objects.filter(**filter_args).order_by('name'):
-                fh.write(f'{te.name};{te.lang};{te.text}\n')
+        with open(options['outfile'], 'w', newline='') as fh:
+            # texts containing the delimiter or quotes are quoted, so loadlang reads them back unchanged
+            writer = csv.writer(fh, delimiter=';', lineterminator='\n')
+            writer.writerow(['name', 'lang', 'text'])
+            entries = TranslationEntry.objects.filter(**filter_args).order_by('name', 'lang').values_list(
+                'name', 'lang', 'text'
+            )
+            for row in entries.iterator(chunk_size=2000):
+                writer.writerow(row)
                 count += 1
         print(f"Dumped {count} entries into {options['outfile']}")
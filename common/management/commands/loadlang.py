@@ -1,31 +1,54 @@
 import csv
+import os
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
-from common.models import TranslationEntry
+from common.models import TranslationEntry, translation_cache
+
+
+def language_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.csv'))
+        elif os.path.isfile(path):
+            yield path
+        else:
+            raise CommandError(f'{path} is neither a file nor a directory')
 
 
 class Command(BaseCommand):
-    help = 'Loads TranslationEntry objects from a CSV file'
+    help = 'Loads TranslationEntry objects from CSV files'
 
     def add_arguments(self, parser):
-        parser.add_argument('infile', type=str, help='Path to output file')
+        parser.add_argument('infiles', type=str, nargs='+', help='Paths to CSV files or directories containing them')
 
     def handle(self, *args, **options):
-        created = 0
-        updated = 0
-        with open(options['infile']) as fh:
-            reader = csv.DictReader(fh, delimiter=';')
-            for row in reader:
-                try:
-                    te = TranslationEntry.objects.get(name=row['name'], lang=row['lang'])
-                    updated += 1
-                except TranslationEntry.DoesNotExist:
-                    te = TranslationEntry.objects.create(name=row['name'], lang=row['lang'])
-                    created += 1
-                finally:
-                    te.text = row['text']
-                    te.save()
-
-        print(f"Created {created} entries from {options['infile']}")
-        print(f"Updated {updated} entries from {options['infile']}")
+        texts = {}
+        for path in language_files(options['infiles']):
+            with open(path, newline='') as fh:
+                for row in csv.DictReader(fh, delimiter=';'):
+                    texts[(row['name'], row['lang'])] = row['text']
+            print(f'Read {path}')
+
+        # the input is compared with all stored entries in memory, only the differences are written
+        with transaction.atomic():
+            existing = {}
+            for te in TranslationEntry.objects.all():
+                existing.setdefault((te.name, te.lang), te)
+
+            created, updated = [], []
+            for (name, lang), text in texts.items():
+                te = existing.get((name, lang))
+                if te is None:
+                    created.append(TranslationEntry(name=name, lang=lang, text=text))
+                elif te.text != text:
+                    te.text = text
+                    updated.append(te)
+            TranslationEntry.objects.bulk_create(created, batch_size=500)
+            TranslationEntry.objects.bulk_update(updated, ['text'], batch_size=500)
+
+        # bulk operations send no signals, the caches are invalidated once for all entries
+        translation_cache.invalidate()
+        print(f'Created {len(created)} entries')
+        print(f'Updated {len(updated)} entries')
@@ -1,4 +1,9 @@
+import hashlib
+import json
+from uuid import uuid4
+
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 
 CHARFIELD_PARAMS = {
@@ -46,7 +51,70 @@ class TranslationEntry(models.Model):
     @staticmethod
     def get(name, alt_lang=None):
         lang = alt_lang or settings.LANGUAGE_CODE
-        try:
-            return TranslationEntry.objects.get(name=name, lang=lang).text
-        except TranslationEntry.DoesNotExist:
-            return name
+        return translation_cache.get(lang).get(name, name)
+
+    @staticmethod
+    def all(alt_lang=None):
+        return translation_cache.get(alt_lang or settings.LANGUAGE_CODE)
+
+
+class TranslationCache:
+    """
+    Process local copy of all translations of a language, loaded on first use.
+
+    Every invalidation stores a new version key in the shared Django cache, other processes
+    drop their copy as soon as they notice a different version (see common.signals).
+    """
+    VERSION_KEY = 'common:translation_version'
+
+    def __init__(self):
+        self.version = None
+        self.translations = {}
+        self.bundles = {}
+        self.languages = None
+
+    def is_known(self, lang):
+        # language codes come from URLs, only the configured language and languages with entries are cached
+        if lang == settings.LANGUAGE_CODE:
+            return True
+        if self.languages is None:
+            self.languages = set(TranslationEntry.objects.order_by().values_list('lang', flat=True).distinct())
+        return lang in self.languages
+
+    def get(self, lang):
+        translations = self.translations.get(lang)
+        if translations is None:
+            if not self.is_known(lang):
+                return {}
+            translations = dict(TranslationEntry.objects.filter(lang=lang).values_list('name', 'text'))
+            self.translations[lang] = translations
+        return translations
+
+    def bundle(self, lang):
+        """Returns the content hash and the serialized translations of a language, None for unknown languages"""
+        bundle = self.bundles.get(lang)
+        if bundle is None:
+            if not self.is_known(lang):
+                return None
+            content = json.dumps(self.get(lang), sort_keys=True, ensure_ascii=False).encode()
+            bundle = (hashlib.sha256(content).hexdigest()[:16], content)
+            self.bundles[lang] = bundle
+        return bundle
+
+    def sync(self):
+        version = cache.get(self.VERSION_KEY)
+        if version != self.version:
+            self.translations = {}
+            self.bundles = {}
+            self.languages = None
+            self.version = version
+
+    def invalidate(self):
+        self.translations = {}
+        self.bundles = {}
+        self.languages = None
+        self.version = uuid4().hex
+        cache.set(self.VERSION_KEY, self.version, timeout=None)
+
+
+translation_cache = TranslationCache()
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from budgets.models import Budget, Category
+from common.lookups import invalidate_lookups
+from common.models import TranslationEntry, translation_cache
+from common.views import invalidate_accessible_budgets
+
+
+@receiver(request_started)
+def sync_translation_cache(**kwargs):
+    translation_cache.sync()
+
+
+@receiver(post_save, sender=TranslationEntry)
+@receiver(post_delete, sender=TranslationEntry)
+def invalidate_translation_cache(**kwargs):
+    translation_cache.invalidate()
+
+
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+@receiver(m2m_changed, sender=Budget.read_access.through)
+@receiver(m2m_changed, sender=Budget.write_access.through)
+def invalidate_budget_caches(action=None, **kwargs):
+    if action is None or action.startswith('post_'):
+        invalidate_accessible_budgets()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_lookups(instance, **kwargs):
+    invalidate_lookups(f'category:{instance.budget_id}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_lookups(update_fields=None, **kwargs):
+    # logins only update the last login time
+    if update_fields is None or 'username' in update_fields:
+        invalidate_lookups('user')
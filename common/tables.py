@@ -0,0 +1,15 @@
+from django_tables2 import tables
+
+from common.models import TranslationEntry
+
+
+class TranslatedTable(tables.Table):
+    """
+    Table whose column verbose names are translation keys, the headers are translated when the table is created
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TranslatedTable, self).__init__(*args, **kwargs)
+        for bound_column in self.columns.iterall():
+            if bound_column.column.verbose_name:
+                bound_column.column.verbose_name = TranslationEntry.get(bound_column.column.verbose_name)
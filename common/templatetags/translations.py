@@ -0,0 +1,23 @@
+from django import template
+from django.conf import settings
+from django.urls import reverse
+
+from common.models import TranslationEntry, translation_cache
+
+register = template.Library()
+
+
+@register.simple_tag
+def translation_bundle_url(lang=None):
+    lang = lang or settings.LANGUAGE_CODE
+    return reverse('common:translation_bundle', kwargs={'lang': lang, 'version': translation_cache.bundle(lang)[0]})
+
+
+@register.simple_tag(name='trans_entry')
+def trans_entry_tag(name, lang=None):
+    return TranslationEntry.get(name, lang)
+
+
+@register.filter(name='trans_entry')
+def trans_entry_filter(name, lang=None):
+    return TranslationEntry.get(name, lang)
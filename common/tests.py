@@ -1,3 +1,230 @@
-# from django.test import TestCase
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.template import Template, Context
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django_tables2 import Column
+
+from budgets.models import Budget
+from common.models import TranslationEntry, TranslationCache, translation_cache
+from common.tables import TranslatedTable
+from common.templatetags.translations import translation_bundle_url
+
+
+class TranslationCacheTest(TestCase):
+    def setUp(self):
+        TranslationEntry.objects.create(name='YES', lang='de', text='Ja')
+        TranslationEntry.objects.create(name='YES', lang='en-us', text='Yes')
+
+    def tearDown(self):
+        translation_cache.invalidate()
+
+    def test_lookup(self):
+        self.assertEqual('Ja', TranslationEntry.get('YES', 'de'))
+        with self.assertNumQueries(0):
+            self.assertEqual('Ja', TranslationEntry.get('YES', 'de'))
+            self.assertEqual('UNKNOWN', TranslationEntry.get('UNKNOWN', 'de'))
+        self.assertEqual('Yes', TranslationEntry.get('YES', 'en-us'))
+
+    def test_invalidation_on_save_and_delete(self):
+        self.assertEqual('Ja', TranslationEntry.get('YES', 'de'))
+        entry = TranslationEntry.objects.get(name='YES', lang='de')
+        entry.text = 'Jawohl'
+        entry.save()
+        self.assertEqual('Jawohl', TranslationEntry.get('YES', 'de'))
+        entry.delete()
+        self.assertEqual('YES', TranslationEntry.get('YES', 'de'))
+
+    def test_version_sync(self):
+        other_worker = TranslationCache()
+        other_worker.sync()
+        self.assertEqual('Ja', other_worker.get('de')['YES'])
+
+        TranslationEntry.objects.filter(name='YES', lang='de').update(text='Jawohl')
+        translation_cache.invalidate()
+        self.assertEqual('Ja', other_worker.get('de')['YES'])
+        other_worker.sync()
+        self.assertEqual('Jawohl', other_worker.get('de')['YES'])
+        self.assertEqual(cache.get(TranslationCache.VERSION_KEY), other_worker.version)
+
+
+class TranslationViewsTest(TestCase):
+    def setUp(self):
+        TranslationEntry.objects.create(name='YES', lang=settings.LANGUAGE_CODE, text='Yes')
+        TranslationEntry.objects.create(name='NO', lang=settings.LANGUAGE_CODE, text='No')
+
+    def tearDown(self):
+        translation_cache.invalidate()
+
+    def test_bundle(self):
+        url = translation_bundle_url()
+        resp = self.client.get(url)
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'YES': 'Yes', 'NO': 'No'}, resp.json())
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', resp.headers['Cache-Control'])
+
+        TranslationEntry.objects.create(name='SAVE', lang=settings.LANGUAGE_CODE, text='Save')
+        self.assertNotEqual(url, translation_bundle_url())
+        resp = self.client.get(url)
+        self.assertEqual(302, resp.status_code)
+        self.assertEqual(translation_bundle_url(), resp.headers['Location'])
+
+    def test_unknown_language(self):
+        TranslationEntry.objects.create(name='YES', lang='de', text='Ja')
+        resp = self.client.get(reverse('common:translation_bundle', kwargs={'lang': 'de', 'version': 'x'}))
+        self.assertEqual(302, resp.status_code)
+
+        for lang in ('xx', 'de-at'):
+            resp = self.client.get(reverse('common:translation_bundle', kwargs={'lang': lang, 'version': 'x'}))
+            self.assertEqual(404, resp.status_code)
+        self.assertLessEqual(set(translation_cache.bundles), {settings.LANGUAGE_CODE, 'de'})
+        self.assertNotIn('xx', translation_cache.translations)
+
+    def test_translation_etag(self):
+        url = reverse('common:translation')
+        resp = self.client.get(url)
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({'YES': 'Yes', 'NO': 'No'}, resp.json())
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=resp.headers['ETag'])
+        self.assertEqual(304, resp.status_code)
+
+    def test_translate_item(self):
+        url = reverse('common:translate')
+        self.assertEqual('Yes', self.client.get(url, {'query': 'YES'}).content.decode())
+        self.assertEqual(404, self.client.get(url, {'query': 'UNKNOWN'}).status_code)
+        self.assertEqual(400, self.client.get(url).status_code)
+        self.assertEqual({'YES': 'Yes', 'NO': 'No'}, self.client.get(url, {'query': 'YES,NO,UNKNOWN'}).json())
+        self.assertEqual({'YES': 'Yes', 'NO': 'No'}, self.client.get(url, {'query': ['YES', 'NO']}).json())
+
+
+class TranslationTemplateTagsTest(TestCase):
+    def setUp(self):
+        TranslationEntry.objects.create(name='YES', lang=settings.LANGUAGE_CODE, text='Yes')
+        TranslationEntry.objects.create(name='YES', lang='de', text='Ja')
+
+    def tearDown(self):
+        translation_cache.invalidate()
+
+    def test_tag(self):
+        template = Template('{% load translations %}{% trans_entry "YES" %} {% trans_entry "YES" "de" %} '
+                            '{% trans_entry "UNKNOWN" %}')
+        self.assertEqual('Yes Ja UNKNOWN', template.render(Context()))
+
+    def test_filter(self):
+        template = Template('{% load translations %}{{ "YES"|trans_entry }} {{ key|trans_entry:"de" }}')
+        self.assertEqual('Yes Ja', template.render(Context({'key': 'YES'})))
+
+    def test_table_headers(self):
+        class Table(TranslatedTable):
+            answer = Column(verbose_name='YES')
+            empty = Column(verbose_name='')
+
+        table = Table([])
+        self.assertEqual('Yes', table.columns['answer'].header)
+        self.assertEqual('YES', Table.base_columns['answer'].verbose_name)
+
+
+class AccessibleBudgetsCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', password='12345')
+        self.budget1 = Budget.objects.create(name='budget1', owner=self.user)
+        self.budget2 = Budget.objects.create(name='budget2')
+        self.client.login(username='user1', password='12345')
+
+    def get_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            content = self.client.get(reverse('index')).content.decode()
+        budget_queries = [q for q in ctx.captured_queries if 'FROM "budgets_budget"' in q['sql']]
+        return content, len(budget_queries)
+
+    def test_cached_list(self):
+        content, num_queries = self.get_index()
+        self.assertIn('budget1', content)
+        self.assertNotIn('budget2', content)
+        self.assertEqual(1, num_queries)
+
+        content, num_queries = self.get_index()
+        self.assertIn('budget1', content)
+        self.assertEqual(0, num_queries)
+
+    def test_invalidation(self):
+        self.get_index()
+        self.budget2.read_access.add(self.user)
+        self.assertIn('budget2', self.get_index()[0])
+
+        self.budget2.read_access.remove(self.user)
+        self.assertNotIn('budget2', self.get_index()[0])
+
+        self.budget1.owner = None
+        self.budget1.save()
+        self.assertNotIn('budget1', self.get_index()[0])
+
+        self.budget2.owner = self.user
+        self.budget2.name = 'renamed'
+        self.budget2.save()
+        self.assertIn('renamed', self.get_index()[0])
+
+    def test_cached_sidebar(self):
+        url = reverse('users:details')
+        self.assertIn('budget1', self.client.get(url).content.decode())
+        with CaptureQueriesContext(connection) as ctx:
+            content = self.client.get(url).content.decode()
+        self.assertIn('budget1', content)
+        self.assertFalse([q for q in ctx.captured_queries if 'budgets_budget_read_access' in q['sql']])
+
+
+class LanguageCommandsTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def entries(self):
+        return sorted(TranslationEntry.objects.values_list('name', 'lang', 'text'))
+
+    def test_load_directory(self):
+        TranslationEntry.objects.create(name='YES', lang='de', text='Jawohl')
+        TranslationEntry.objects.create(name='NO', lang='de', text='Nein')
+        self.write('de.csv', 'name;lang;text\nYES;de;Ja\nNO;de;Nein\n')
+        self.write('en-us.csv', 'name;lang;text\nYES;en-us;Yes\n')
+        self.write('README', 'ignored')
+        self.assertEqual('Jawohl', TranslationEntry.get('YES', 'de'))
+
+        out = io.StringIO()
+        with redirect_stdout(out), CaptureQueriesContext(connection) as ctx:
+            call_command('loadlang', self.tmp.name)
+        self.assertIn('Created 1 entries', out.getvalue())
+        self.assertIn('Updated 1 entries', out.getvalue())
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+        self.assertEqual([('NO', 'de', 'Nein'), ('YES', 'de', 'Ja'), ('YES', 'en-us', 'Yes')], self.entries())
+        self.assertEqual('Ja', TranslationEntry.get('YES', 'de'))
+
+        with self.assertRaises(CommandError):
+            call_command('loadlang', os.path.join(self.tmp.name, 'missing.csv'))
+
+    def test_dump_round_trip(self):
+        TranslationEntry.objects.create(name='QUOTED', lang='de', text='a;b "c"')
+        TranslationEntry.objects.create(name='YES', lang='de', text='Ja')
+        path = os.path.join(self.tmp.name, 'de.csv')
+        call_command('dumplang', path, lang='de')
+        expected = self.entries()
+
+        TranslationEntry.objects.all().delete()
+        call_command('loadlang', path)
+        self.assertEqual(expected, self.entries())
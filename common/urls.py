@@ -1,8 +1,9 @@
 from django.urls import path
 
-from common.views import TranslateItemView, TranslationView
+from common.views import TranslateItemView, TranslationView, TranslationBundleView
 
 urlpatterns = [
     path('translate/item', TranslateItemView.as_view(), name='translate'),
     path('translate/all', TranslationView.as_view(), name='translation'),
+    path('translate/bundle/<str:lang>/<str:version>.json', TranslationBundleView.as_view(), name='translation_bundle'),
 ]
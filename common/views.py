@@ -1,24 +1,64 @@
+from uuid import uuid4
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import render, redirect
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from django.views import View
+from django.views.decorators.http import etag
 
 from budgets.models import Budget
-from common.models import TranslationEntry
+from common.models import TranslationEntry, translation_cache
 
+# bundle URLs contain the content hash, so they never change
+TRANSLATION_BUNDLE_MAX_AGE = 365 * 24 * 60 * 60
 
-def common_ctx(request, budget=None):
-    if request.user.is_superuser:
-        budgets = Budget.objects.all()
-    else:
-        budgets = set(Budget.objects.filter(Q(read_access__in=[request.user]) | Q(owner=request.user)))
+# changed whenever a budget, its owner or its members change
+BUDGETS_VERSION_KEY = 'common:budgets_version'
+BUDGETS_CACHE_TIMEOUT = 60 * 60
+
+
+def budgets_version():
+    version = cache.get(BUDGETS_VERSION_KEY)
+    if version is None:
+        cache.add(BUDGETS_VERSION_KEY, uuid4().hex, timeout=None)
+        version = cache.get(BUDGETS_VERSION_KEY)
+    return version
+
+
+def invalidate_accessible_budgets():
+    cache.set(BUDGETS_VERSION_KEY, uuid4().hex, timeout=None)
+
+
+def accessible_budgets(user, version=None):
+    key = f'common:budgets:{version or budgets_version()}:{user.id}:{int(user.is_superuser)}'
+    budgets = cache.get(key)
+    if budgets is None:
+        if user.is_superuser:
+            budgets = Budget.objects.all()
+        else:
+            budgets = Budget.objects.filter(Q(read_access=user) | Q(owner=user)).distinct()
+        budgets = list(budgets.order_by('name'))
+        cache.set(key, budgets, timeout=BUDGETS_CACHE_TIMEOUT)
+    return budgets
 
+
+def common_ctx(request, budget=None):
+    version = budgets_version()
+    sidebar_key = ':'.join(
+        str(part) for part in (version, request.user.id, int(request.user.is_superuser),
+                               budget.id if budget else '', translation_cache.version)
+    )
     return {
-        'my_budgets': budgets,
-        'budget': budget
+        # only evaluated if the page lists the budgets or the cached sidebar is outdated
+        'my_budgets': SimpleLazyObject(lambda: accessible_budgets(request.user, version)),
+        'budget': budget,
+        'sidebar_cache_key': sidebar_key,
     }
 
 
@@ -36,24 +76,45 @@ class AuthenticatedUserView(View):
         return super(AuthenticatedUserView, self).dispatch(request, *args, **kwargs)
 
 
+def translation_etag(request, *args, **kwargs):
+    return translation_cache.bundle(settings.LANGUAGE_CODE)[0]
+
+
 class TranslateItemView(View):
+    @method_decorator(etag(translation_etag))
     def get(self, request):
-        query = request.GET.get('query', None)
-        if not query:
+        queries = [name for value in request.GET.getlist('query') for name in value.split(',') if name]
+        if not queries:
             return HttpResponse('query param missing', status=400)
 
-        try:
-            return HttpResponse(TranslationEntry.objects.get(name=query).text)
-        except TranslationEntry.DoesNotExist:
+        translations = TranslationEntry.all()
+        if len(queries) > 1:
+            return JsonResponse({q: translations[q] for q in queries if q in translations})
+
+        query = queries[0]
+        if query not in translations:
             return HttpResponse(f'No translation found for "{query}"', status=404)
+        return HttpResponse(translations[query])
 
 
 class TranslationView(View):
+    @method_decorator(etag(translation_etag))
     def get(self, request):
-        return JsonResponse({
-            te.name: te.text
-            for te in TranslationEntry.objects.filter(lang=settings.LANGUAGE_CODE)
-        })
+        return HttpResponse(translation_cache.bundle(settings.LANGUAGE_CODE)[1], content_type='application/json')
+
+
+class TranslationBundleView(View):
+    def get(self, request, lang, version):
+        bundle = translation_cache.bundle(lang)
+        if bundle is None:
+            raise Http404()
+        current_version, content = bundle
+        if version != current_version:
+            return redirect('common:translation_bundle', lang=lang, version=current_version)
+
+        resp = HttpResponse(content, content_type='application/json')
+        patch_cache_control(resp, public=True, max_age=TRANSLATION_BUNDLE_MAX_AGE, immutable=True)
+        return resp
 
 
 def error_403(request, exception):
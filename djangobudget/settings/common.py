@@ -125,6 +125,10 @@ DJANGO_TABLES2_TABLE_ATTRS = {
     'style': 'width:100%;',
 }
 
+# number of rows per page of the expense tables and of the recent expenses on the dashboard
+EXPENSES_PAGE_SIZE = int(os.environ.get('DJANGOBUDGET_EXPENSES_PAGE_SIZE', 50))
+DASHBOARD_RECENT_EXPENSES = int(os.environ.get('DJANGOBUDGET_DASHBOARD_RECENT_EXPENSES', 10))
+
 BOOTSTRAP4 = {
     'success_css_class': '',
 }
@@ -21,3 +21,11 @@ DATABASES = {
         },
     }
 }
+
+# Shared between all gunicorn workers, e.g. to keep the process local translation caches in sync
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGOBUDGET_CACHE_DIR', '/var/tmp/djangobudget_cache'),
+    }
+}
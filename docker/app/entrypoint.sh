@@ -18,9 +18,7 @@ function init_db () {
     echo "Database $MYSQL_DATABASE empty. Run initial migrations ..."
     python manage.py migrate
     echo "Load languages ..."
-    for file in $(ls common/res/lang); do
-        python manage.py loadlang common/res/lang/$file
-    done
+    python manage.py loadlang common/res/lang
     echo "Create admin account"
     python manage.py createsuperuser --noinput
     echo "Create sample budget"
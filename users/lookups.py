@@ -9,6 +9,7 @@ class UserReadAccessLookup(ItemLookup):
     model = User
     filter_field = 'username'
     suffix = 'read_access'
+    permission = 'owner'
 
 
 @register('user_write_access')
@@ -16,3 +17,4 @@ class UserWriteAccessLookup(ItemLookup):
     model = User
     filter_field = 'username'
     suffix = 'write_access'
+    permission = 'owner'